@@ -1,11 +1,17 @@
 import numpy as np
 from abc import ABC, abstractmethod
 
-from pen_base import PenGrid
-from hex_base import HexGrid
+from pen_base import PenArrayGrid
+from hex_base import HexArrayGrid
 from pen_pregen import get_pen_mother_tiles
-from hex_pregen import get_hex_mother_tiles
-from utils import inscribed_square_halfside
+from hex_pregen import get_hex_mother_arrays
+from utils import inscribed_square_halfside, box_coverage, mask_pixels
+from canvas_cache import load_canvas, save_canvas, cache_path, load_extra, save_extra
+from grid_index import GridIndex
+from generator_stats import GeneratorStats
+from adjacency import adjacency
+from pentagrid import pentagrid_tiles, random_offsets
+from recipes import RECIPE_DTYPE, check_replayable
 
 from hex_svg import save_svg as hex_save_svg
 from pen_svg import save_svg as pen_save_svg
@@ -13,24 +19,38 @@ from pen_svg import save_svg as pen_save_svg
 from ImageSet import ImageSet
 
 class Generator(ABC):
+    kind:str = ""
     unit_area:float = 1.0
     rot_range:float = np.pi
+    batch_chunk_tiles:int = 1 << 16   # Max candidate tiles (about) processed at once by get_batch, kept cache sized
+    print_diagnostics:bool = True     # get_sample prints the samples that are short of well covered tiles
+    replayable:bool = True            # Whether the recipes fix the samples, see replay
 
-    def __init__(self, imageset, sample_size, target_halfside, unit_side):
+    def __init__(self, imageset, sample_size, target_halfside, unit_side, cache_dir=None, coverage="corners",
+                 pyramid_pixels=None):
         """
         Build a grid covering square region ([-C, C] × [-C, C]). C = tothalfside
+        If cache_dir is given, the canvas columns are memory-mapped from there (and stored on the first run).
+        coverage: How much of a tile's equivalent square is on the mask
+            "corners": number of its four corners that land on the mask
+            "area": exact covered fraction (from summed-area tables) quantized to 0..4 quarters, rounding up
+        pyramid_pixels: for "corners", look the corners up in the coarsest level of the mask pyramids
+            (see utils.mask_pyramid) that still has about this many pixels across a tile's equivalent square.
+            None to always use the full masks.
         """
-
-        self.canvas = self._get_mother_tiles(target_halfside, unit_side)
-        self.canvas_xy = np.array([(h.x, h.y) for h in self.canvas], dtype=float)
-        self.colors = np.array([h.color for h in self.canvas])
-        self.angles = np.array([h.angle for h in self.canvas])
-        self.sides = np.array([h.side for h in self.canvas])
+        if coverage not in ("corners", "area"):
+            raise ValueError(f"Unknown coverage mode: {coverage}")
+        self.coverage = coverage
+        if coverage == "area":
+            imageset.add_summed_area_tables()
+        self.pyramid_pixels = pyramid_pixels
+        if pyramid_pixels is not None:
+            imageset.add_pyramids()
 
         self.imageset = imageset
-        self.halfside = inscribed_square_halfside(self.canvas)
         self.unit_side = unit_side
         self.sample_size = sample_size
+        self._load_canvas(target_halfside, cache_dir)
 
         print(f"  UnitSide: {self.unit_side}")
         print(f"  CanvasHalfSide: {self.halfside:.2f} (vs. {target_halfside})")
@@ -38,9 +58,34 @@ class Generator(ABC):
         print(f"  Sampling Size: {self.sample_size}")
 
         self.imagesetiter = iter(self.imageset)
+        self._stats = None
+
+    def enable_stats(self, log_every=None, log=None):
+        """
+        Start collecting GeneratorStats (stage timings, coverage histogram, shortfalls, per class scaling)
+        in get_sample and get_batch, optionally logging a summary every log_every samples.
+        """
+        self._stats = GeneratorStats(self.sample_size, log_every, log)
+        return self._stats
+
+    def stats(self):
+        """ Snapshot of the stats as a dict, None unless enable_stats was called. """
+        return None if self._stats is None else self._stats.snapshot()
+
+    def pack_masks(self):
+        """
+        Build the packed mask tables get_batch looks up (they are built lazily, on the first use),
+        so that worker threads share them rather than race to build them, and forked workers inherit them.
+        """
+        self.imageset.packed_masks()
+        if self.coverage == "area":
+            self.imageset.packed_sats()
+        elif self.pyramid_pixels is not None:
+            self.imageset.packed_pyramids()
 
     @abstractmethod
-    def _get_mother_tiles(self, tothalfside, unit_side):
+    def _load_canvas(self, target_halfside, cache_dir):
+        """ Set up what the windows are cut from, and the halfside of the square they are placed in. """
         raise NotImplementedError
 
     @property
@@ -51,8 +96,60 @@ class Generator(ABC):
     def density(self):
         return 1./self.area_of_one_unit
 
-    def get_sample(self):
-        sample = next(self.imagesetiter)
+    def _window_disc(self, theta, x0, y0, H, W, scaling):
+        """
+        Center and radius, in canvas coordinates, of a disc holding all the tiles that can get any coverage
+        from a H×W mask placed at (x0, y0) on the canvas rotated by theta.
+        Whatever the mask rotation, the corners that land on the mask are within the circle
+        about the mask center through its (half pixel padded) corners.
+        """
+        cx, cy = x0 + H * scaling / 2, y0 + W * scaling / 2
+        ct, st = np.cos(theta), np.sin(theta)
+        r = scaling * np.hypot(H / 2 + .5, W / 2 + .5) + np.sqrt(2 * self.area_of_one_unit) / 2 + self.unit_side
+        return cx * ct + cy * st, cy * ct - cx * st, r
+
+    @abstractmethod
+    def _tiles_near(self, theta, x0, y0, H, W, scaling, rng):
+        """
+        The tiles that can be covered by the mask window (see _window_disc).
+        Returns their (k, 2) canvas coordinates, colors, angles and sides.
+        """
+        raise NotImplementedError
+
+    def _tiles_near_batch(self, theta, x0, y0, H, W, scaling, rng):
+        """
+        _tiles_near for arrays of windows, as (indptr, rows, (xy, colors, angles, sides)):
+        the tiles near window k are rows[indptr[k]:indptr[k+1]] of the columns.
+        """
+        tiles = [self._tiles_near(*args, rng) for args in zip(theta, x0, y0, H, W, scaling)]
+        indptr = np.concatenate([[0], np.cumsum([len(t[0]) for t in tiles], dtype=np.int64)])
+        columns = tuple(np.concatenate([t[c] for t in tiles]) for c in range(4))
+        return indptr, np.arange(indptr[-1]), columns
+
+    def _pyramid_level(self, eqsqhfsd, num_levels):
+        """ Pyramid level(s) to look the corners up in, for equivalent square half side(s) eqsqhfsd in pixels. """
+        if self.pyramid_pixels is None:
+            return np.zeros_like(num_levels)
+        level = np.floor(np.log2(np.maximum(2 * eqsqhfsd / self.pyramid_pixels, 1)))
+        return np.minimum(level.astype(np.int64), num_levels - 1)
+
+    @staticmethod
+    def _coverage_levels(frac):
+        """ Covered fraction to the 0..4 levels of the selection loop, any coverage at all counts as 1. """
+        return np.clip(np.ceil(4 * frac - 1e-9), 0, 4).astype(np.int8)
+
+    def get_sample(self, rng=None):
+        """
+        rng: an optional np.random.Generator, the global np.random state is used otherwise.
+        """
+        stats = self._stats
+        if stats:
+            stats.start()
+        if rng is None:
+            rng = np.random
+            sample = next(self.imagesetiter)
+        else:
+            sample = self.imageset.get_random_sample(rng)
         H, W = sample.mask.shape
 
         scaling = np.sqrt(self.sample_size / (sample.on * self.density))
@@ -62,37 +159,54 @@ class Generator(ABC):
 
 
         # Rotate Canvas
-        theta = np.random.uniform(-self.rot_range, self.rot_range)
+        theta = rng.uniform(-self.rot_range, self.rot_range)
         ct, st = np.cos(theta), np.sin(theta)
         rot_mat = np.array([[ct, st], [-st, ct]])  # important minus goes here
-        xy_rot = self.canvas_xy @ rot_mat
 
         # Translate Canvas
-        x0 = np.random.uniform(-self.halfside, self.halfside - hw2c(H))
-        y0 = np.random.uniform(-self.halfside, self.halfside - hw2c(W))
-        new_xy = xy_rot - np.array([x0, y0])
+        x0 = rng.uniform(-self.halfside, self.halfside - hw2c(H))
+        y0 = rng.uniform(-self.halfside, self.halfside - hw2c(W))
 
         # Rotate Mask
-        thetamask = np.random.uniform(-self.rot_range/3, self.rot_range/3)
+        thetamask = rng.uniform(-self.rot_range/3, self.rot_range/3)
         ct, st = np.cos(thetamask), np.sin(thetamask)
         rot_mask = np.array([[ct, -st], [st, ct]])
 
-        coverage = np.zeros(self.canvas_xy.shape[0], dtype=int)
+        # Only the tiles near the window can be covered
+        xy, colors, angles, sides = self._tiles_near(theta, x0, y0, H, W, scaling, rng)
+        if stats:
+            stats.lap("tiles")
+        xy_rot = xy @ rot_mat
+        new_xy = xy_rot - np.array([x0, y0])
+        if stats:
+            stats.lap("rotate")
+
+        coverage = np.zeros(len(xy), dtype=int)
+        level = 0 if sample.pyramid is None else int(self._pyramid_level(eqsqhfsd, len(sample.pyramid)))
+        mask = sample.pyramid[level] if level else sample.mask
         def update_coverage(uu, vv):
             uuvv = np.stack([uu, vv], axis=1) - np.array([H/2, W/2])
             uuvv = uuvv @ rot_mask + np.array([H/2, W/2])
             uu = np.round(uuvv[:, 0]).astype(int)
             vv = np.round(uuvv[:, 1]).astype(int)
             is_in_bounds = (uu >= 0) & (uu < H) & (vv >= 0) & (vv < W)
-            coverage[is_in_bounds] += sample.mask[uu[is_in_bounds], vv[is_in_bounds]]
+            coverage[is_in_bounds] += mask[uu[is_in_bounds] >> level, vv[is_in_bounds] >> level]
 
         # half-square corners in float coords
         uv = c2hw(new_xy)
         u, v = uv[:, 0], uv[:, 1]
-        update_coverage(u - eqsqhfsd, v - eqsqhfsd)
-        update_coverage(u - eqsqhfsd, v + eqsqhfsd)
-        update_coverage(u + eqsqhfsd, v - eqsqhfsd)
-        update_coverage(u + eqsqhfsd, v + eqsqhfsd)
+        if self.coverage == "area":
+            uuvv = (uv - np.array([H/2, W/2])) @ rot_mask + np.array([H/2, W/2])
+            frac = box_coverage(sample.sat.ravel(), 0, H, W, uuvv[:, 0], uuvv[:, 1], eqsqhfsd)
+            coverage = self._coverage_levels(frac)
+        else:
+            update_coverage(u - eqsqhfsd, v - eqsqhfsd)
+            update_coverage(u - eqsqhfsd, v + eqsqhfsd)
+            update_coverage(u + eqsqhfsd, v - eqsqhfsd)
+            update_coverage(u + eqsqhfsd, v + eqsqhfsd)
+
+        if stats:
+            stats.lap("coverage")
 
         sets_idx = {val: np.flatnonzero(coverage == val) for val in (1, 2, 3, 4)}
         ret = np.zeros((self.sample_size, 5), dtype=float)
@@ -107,15 +221,18 @@ class Generator(ABC):
             take = idxs[:self.sample_size - taken]
             if len(take) > 0:
                 ret[taken:taken + len(take), :2] = new_xy[take]
-                ret[taken:taken + len(take), 2] = self.colors[take]
-                ret[taken:taken + len(take), 3] = self.angles[take] + theta
-                ret[taken:taken + len(take), 4] = self.sides[take]
+                ret[taken:taken + len(take), 2] = colors[take]
+                ret[taken:taken + len(take), 3] = angles[take] + theta
+                ret[taken:taken + len(take), 4] = sides[take]
                 taken += len(take)
 
         name = f"{sample.classname}-{sample.inclassid:02d}"
+        if stats:
+            stats.lap("selection")
+            stats.add(np.bincount(coverage, minlength=5)[None], [sample.classname], [scaling])
+
         # diagnostics printout
-        if take_now < 2 or taken < self.sample_size:
-            sets_idx = [np.where(coverage == val)[0] for val in range(5)]  # 0..4
+        if self.print_diagnostics and (take_now < 2 or taken < self.sample_size):
             print(f"{sample.classid:02d} {name:20s} ({H:3d}, {W:3d}) {sample.on/(H*W):.0%}"
               f"\t±{self.halfside:.1f}/{scaling:.3f} = ±{self.halfside/scaling:.0f} {self.unit_side}->{2*eqsqhfsd:.1f}"
               f"\tmapped_to: ({x0:+.2f}, {y0:+.2f}) to ({x0+hw2c(H):+.2f}, {y0+hw2c(W):+.2f}) rot={theta:+.2f}({theta*180/np.pi:+.0f}°)"
@@ -124,43 +241,329 @@ class Generator(ABC):
         # return the actual canvas objects in the same order as original code
         return ret, name
 
+    def draw_recipes(self, n, rng=None):
+        """
+        The random parameters of n samples, as a recipes.RECIPE_DTYPE array of (image, theta, x0, y0, thetamask),
+        drawn as get_batch does. replay(recipes) makes the samples, unless the generator is not replayable.
+        rng: an optional np.random.Generator, the global np.random state is used otherwise.
+        """
+        heights, widths, ons = self.imageset.mask_sizes()
+        if rng is None:
+            rng = np.random
+            idx = rng.randint(0, len(self.imageset), size=n)
+        else:
+            idx = rng.integers(0, len(self.imageset), size=n)
+        H, W = heights[idx], widths[idx]
+        scaling = np.sqrt(self.sample_size / (ons[idx] * self.density))
+
+        recipes = np.empty(n, dtype=RECIPE_DTYPE)
+        recipes["image"] = idx
+        recipes["theta"] = rng.uniform(-self.rot_range, self.rot_range, size=n)
+        recipes["x0"] = rng.uniform(-self.halfside, self.halfside - H * scaling)
+        recipes["y0"] = rng.uniform(-self.halfside, self.halfside - W * scaling)
+        recipes["thetamask"] = rng.uniform(-self.rot_range/3, self.rot_range/3, size=n)
+        return recipes
+
+    def get_batch(self, n, out=None, rng=None):
+        """
+        Draw n samples at once.
+        All the random parameters are drawn as arrays up front, the windows' candidate tiles are gathered with one
+        index query per chunk of samples and coverage and selection run on the flat candidates of the chunk.
+        That is about 1.6x the samples per second of get_sample (500 tile samples, 12 masks, one core).
+        rng: an optional np.random.Generator, the global np.random state is used otherwise.
+        Returns a float32 array of shape (n, sample_size, 5) (written into out if given) and the list of names.
+        """
+        if self._stats:
+            self._stats.start()
+        recipes = self.draw_recipes(n, rng)
+        return self._render(recipes, out, np.random if rng is None else rng)
+
+    def replay(self, recipes, out=None):
+        """
+        The samples of recipes (from draw_recipes, or a recipe log), exactly as get_batch made them.
+        Returns a float32 array of shape (len(recipes), sample_size, 5) (written into out if given) and the names.
+        """
+        check_replayable(self)
+        if self._stats:
+            self._stats.start()
+        return self._render(recipes, out, None)
+
+    def _render(self, recipes, out, rng):
+        n = len(recipes)
+        if out is None:
+            out = np.empty((n, self.sample_size, 5), dtype=np.float32)
+
+        heights, widths, ons = self.imageset.mask_sizes()
+        idx = recipes["image"].astype(np.int64)
+        H, W = heights[idx], widths[idx]
+        scaling = np.sqrt(self.sample_size / (ons[idx] * self.density))
+        theta, x0, y0, thetamask = (recipes[k] for k in ("theta", "x0", "y0", "thetamask"))
+
+        # Chunk the batch so that the (chunk, K) intermediates stay bounded, K being the most tiles near a window
+        # (estimated from the area of the window discs)
+        _, _, r = self._window_disc(theta, x0, y0, H, W, scaling)
+        most_tiles = np.pi * r.max() ** 2 * self.density if n else 1
+        chunk = max(1, int(self.batch_chunk_tiles // max(most_tiles, 1)))
+        counts = []
+        for i in range(0, n, chunk):
+            s = slice(i, i + chunk)
+            tiles = self._tiles_near_batch(theta[s], x0[s], y0[s], H[s], W[s], scaling[s], rng)
+            if self._stats:
+                self._stats.lap("tiles")
+            counts.append(self._fill_batch(out[s], *tiles, idx[s], scaling[s], theta[s], x0[s], y0[s], thetamask[s]))
+
+        names = [self.imageset.name(k) for k in idx]
+        if self._stats and n:
+            self._stats.add(np.concatenate(counts), [self.imageset.classnames[k] for k in idx], scaling)
+        return out, names
+
+    def _fill_batch(self, out, indptr, rows, columns, idx, scaling, theta, x0, y0, thetamask):
+        """
+        Coverage and selection for a chunk of the batch.
+        indptr, rows, columns: the tiles near each window, from _tiles_near_batch
+        Other per sample arrays have shape (m,), idx being the image indices.
+        All the candidate tiles of the chunk are processed as one flat array, each knowing its sample (owner).
+        Returns the (m, 5) numbers of tiles at each coverage level when collecting stats.
+        """
+        m = len(idx)
+        flat, offsets, heights, widths, _ = self.imageset.packed_masks()
+        H, W = heights[idx], widths[idx]
+        xy, colors, angles, sides = columns
+        counts = np.diff(indptr)
+        owner = np.repeat(np.arange(m), counts)
+        stats = self._stats
+
+        # Canvas to mask pixel coordinates in one affine map per sample: rotate and translate the canvas,
+        # scale into pixels and rotate the mask about its center (as get_sample does in steps)
+        cm, sm = np.cos(thetamask), np.sin(thetamask)
+        ca, sa = np.cos(theta - thetamask) / scaling, np.sin(theta - thetamask) / scaling
+        h2, w2 = H / 2, W / 2
+        cu = h2 - h2 * cm - w2 * sm - (x0 * cm + y0 * sm) / scaling
+        cv = w2 - w2 * cm + h2 * sm - (y0 * cm - x0 * sm) / scaling
+        cand = xy[rows]
+        x, y = cand[:, 0], cand[:, 1]
+        ca_, sa_ = np.repeat(ca, counts), np.repeat(sa, counts)
+        pu = x * ca_ - y * sa_ + np.repeat(cu, counts)
+        pv = x * sa_ + y * ca_ + np.repeat(cv, counts)
+
+        # Only the tiles with a corner of their equivalent square (at most √2 of its half side away) near the mask
+        # can be covered, drop the others
+        eqsqhfsd = np.sqrt(self.area_of_one_unit) / scaling / 2.0
+        reach = np.repeat(np.sqrt(2) * eqsqhfsd + 1, counts)
+        near = (pu > -reach) & (pu < np.repeat(H, counts) + reach) & (pv > -reach) & (pv < np.repeat(W, counts) + reach)
+        owner, rows, pu, pv = owner[near], rows[near], pu[near], pv[near]
+        cm, sm = cm[owner], sm[owner]
+        if stats:
+            stats.lap("rotate")
+
+        Hc, Wc, e = H[owner], W[owner], eqsqhfsd[owner]
+        if self.coverage == "area":
+            # Covered fraction of the equivalent square of each tile
+            sats, sat_offsets = self.imageset.packed_sats()
+            frac = box_coverage(sats, sat_offsets[idx][owner], Hc, Wc, pu, pv, e)
+            coverage = self._coverage_levels(frac)
+        else:
+            # Count the covered corners of the equivalent square of each tile
+            if self.pyramid_pixels is None:
+                off, Wl, level = offsets[idx][owner], Wc, 0
+            else:
+                flat, offsets, _, widths, num_levels = self.imageset.packed_pyramids()
+                levels = self._pyramid_level(eqsqhfsd, num_levels[idx])
+                off, Wl, level = offsets[idx, levels][owner], widths[idx, levels][owner], levels[owner]
+            coverage = np.zeros(len(owner), dtype=np.int8)
+            for du, dv in ((-1, -1), (-1, 1), (1, -1), (1, 1)):
+                uu = np.round(pu + e * (du * cm + dv * sm)).astype(np.int64)
+                vv = np.round(pv + e * (dv * cm - du * sm)).astype(np.int64)
+                is_in_bounds = (uu >= 0) & (uu < Hc) & (vv >= 0) & (vv < Wc)
+                pixel = np.where(is_in_bounds, off + (uu >> level) * Wl + (vv >> level), 0)
+                coverage += mask_pixels(flat, pixel, self.imageset.packed_bits) & is_in_bounds
+
+        if stats:
+            stats.lap("coverage")
+
+        # Take tiles in the order of decreasing coverage (4, 3, 2, 1), in canvas order within a level:
+        # a stable sort by (sample, 4 - coverage) and the first sample_size covered ones of each sample
+        order = np.argsort(owner * 5 + (4 - coverage), kind='stable')
+        owner, coverage = owner[order], coverage[order]
+        rank = np.arange(len(owner)) - np.searchsorted(owner, owner)
+        taken = (rank < self.sample_size) & (coverage > 0)
+        sel, sel_owner, sel_rank = order[taken], owner[taken], rank[taken]
+        sel_rows = rows[sel]
+
+        # Rotate and translate only the picked tiles
+        x, y = xy[sel_rows, 0], xy[sel_rows, 1]
+        ct, st = np.cos(theta)[sel_owner], np.sin(theta)[sel_owner]
+        out[:] = 0
+        out[sel_owner, sel_rank, 0] = x * ct - y * st - x0[sel_owner]
+        out[sel_owner, sel_rank, 1] = x * st + y * ct - y0[sel_owner]
+        out[sel_owner, sel_rank, 2] = colors[sel_rows]
+        out[sel_owner, sel_rank, 3] = angles[sel_rows] + theta[sel_owner]
+        out[sel_owner, sel_rank, 4] = sides[sel_rows]
+
+        if stats:
+            stats.lap("selection")
+            # Tiles at each coverage level per sample, the dropped ones having none
+            levels = np.bincount(owner * 5 + coverage, minlength=5 * m).reshape(m, 5)
+            levels[:, 0] += counts - levels.sum(axis=1)
+            return levels
+
+
+class CanvasGenerator(Generator):
+    """ A Generator that cuts the windows from one big pregenerated canvas, optionally cached on disk. """
+    def _load_canvas(self, target_halfside, cache_dir):
+        """
+        Set up the canvas columns (canvas_xy, colors, angles, sides), its halfside and its spatial index.
+        """
+        unit_side = self.unit_side
+        self.cache_dir, self.target_halfside = cache_dir, target_halfside
+        cached = None
+        if cache_dir is not None:
+            cached = load_canvas(cache_dir, self.kind, target_halfside, unit_side)
+
+        if cached is None:
+            self.canvas_xy, self.colors, self.angles, self.sides = self._get_mother_columns(target_halfside, unit_side)
+            if cache_dir is not None:
+                save_canvas(cache_dir, self.kind, target_halfside, unit_side,
+                            dict(xy=self.canvas_xy, color=self.colors, angle=self.angles, side=self.sides))
+        else:
+            print(f"  Canvas loaded from cache: {cache_path(cache_dir, self.kind, target_halfside, unit_side)}")
+            self.canvas = None
+            self.canvas_xy = cached["xy"]
+            self.colors = cached["color"]
+            self.angles = cached["angle"]
+            self.sides = cached["side"]
+
+        self.halfside = inscribed_square_halfside(self.canvas_xy)
+
+        # Buckets of about 16 tiles each
+        self.index = GridIndex(self.canvas_xy, cell_size=4 * self.unit_side)
+
+    def canvas_adjacency(self):
+        """
+        Edge sharing neighbours of the canvas tiles in CSR form (indptr, indices), see adjacency.adjacency.
+        Stored in (and loaded from) the canvas cache when there is one.
+        """
+        key = (self.cache_dir, self.kind, self.target_halfside, self.unit_side)
+        cached = None if self.cache_dir is None else load_extra(*key, "adjacency")
+        if cached is not None:
+            return cached["indptr"], cached["indices"]
+
+        matrix = np.column_stack([self.canvas_xy, self.colors, self.angles, self.sides])
+        indptr, indices = adjacency(matrix, self.kind)
+        if self.cache_dir is not None:
+            save_extra(*key, "adjacency", dict(indptr=indptr, indices=indices))
+        return indptr, indices
 
-class Generator6(Generator):
+    @abstractmethod
+    def _get_mother_columns(self, tothalfside, unit_side):
+        """ The canvas as (N, 2) centers and colors, angles, sides arrays. Keeps any tile objects in self.canvas. """
+        raise NotImplementedError
+
+    def _tiles_near(self, theta, x0, y0, H, W, scaling, rng):
+        """ The tiles near the window (see Generator._tiles_near), in canvas order. """
+        cand = self.index.query_disc(*self._window_disc(theta, x0, y0, H, W, scaling))
+        return self.canvas_xy[cand], self.colors[cand], self.angles[cand], self.sides[cand]
+
+    def _tiles_near_batch(self, theta, x0, y0, H, W, scaling, rng):
+        """ All the windows in one bulk query of the index, the rows being canvas indices (in canvas order). """
+        indptr, rows = self.index.query_discs(*self._window_disc(theta, x0, y0, H, W, scaling))
+        return indptr, rows, (self.canvas_xy, self.colors, self.angles, self.sides)
+
+
+def tile_columns(tiles):
+    """ The (N, 2) centers and colors, angles, sides arrays of an iterable of tile objects. """
+    return (np.array([(h.x, h.y) for h in tiles], dtype=float),
+            np.array([h.color for h in tiles]),
+            np.array([h.angle for h in tiles]),
+            np.array([h.side for h in tiles]))
+
+
+class Generator6(CanvasGenerator):
+    kind = "hex"
     unit_area = 3. * np.sqrt(3.) / 2.
     rot_range = np.pi/6
 
-    def _get_mother_tiles(self, tothalfside, unit_side):
-        canvas = get_hex_mother_tiles(tothalfside, unit_side)
-        hex_save_svg(canvas, "hex_canvas.svg")
-        return canvas
+    def _get_mother_columns(self, tothalfside, unit_side):
+        self.canvas = None
+        tiles = get_hex_mother_arrays(tothalfside, unit_side)
+        hex_save_svg(HexArrayGrid(tiles), "hex_canvas.svg")
+        return tiles[:, :2], tiles[:, 2].astype(int), tiles[:, 3], tiles[:, 4]
 
 
 from pen_base import psi, psi2
-class Generator5(Generator):
+class Generator5(CanvasGenerator):
+    kind = "pen"
     unit_area = np.sin(np.pi/5) * psi2 + np.sin(2*np.pi/5) * psi
     rot_range = np.pi/2
 
-    def _get_mother_tiles(self, tothalfside, unit_side):
-        canvas = get_pen_mother_tiles(tothalfside, unit_side)
-        pen_save_svg(canvas, "pen_canvas.svg")
-        return canvas
+    def _get_mother_columns(self, tothalfside, unit_side):
+        self.canvas = get_pen_mother_tiles(tothalfside, unit_side)
+        pen_save_svg(self.canvas, "pen_canvas.svg")
+        return tile_columns(self.canvas)
+
+
+class PentagridGenerator5(Generator):
+    """
+    A Generator5 without a canvas: each sample is cut from a fresh Penrose patch,
+    built by de Bruijn's pentagrid construction with random offsets over just the window of the sample.
+    target_halfside only bounds where the windows are placed.
+    The offsets are not part of the recipes, so the samples can not be replayed.
+    """
+    kind, unit_area, rot_range = Generator5.kind, Generator5.unit_area, Generator5.rot_range
+    replayable = False
+
+    def _load_canvas(self, target_halfside, cache_dir):
+        self.canvas = self.canvas_xy = self.colors = self.angles = self.sides = self.index = None
+        self.halfside = target_halfside
+
+    def _tiles_near(self, theta, x0, y0, H, W, scaling, rng):
+        cx, cy, r = self._window_disc(theta, x0, y0, H, W, scaling)
+        tiles = pentagrid_tiles(random_offsets(rng), cx - r, cy - r, cx + r, cy + r, side=self.unit_side)
+        tiles = tiles[np.hypot(tiles[:, 0] - cx, tiles[:, 1] - cy) <= r]
+        return tiles[:, :2], tiles[:, 2], tiles[:, 3], tiles[:, 4]
 
 
 if __name__ == "__main__":
+    import sys
     from tqdm import tqdm
     # tqdm = lambda x: x
 
+    try:
+        mode = sys.argv[1]
+        num_samples = int(sys.argv[2]) if mode in ("export", "recipes") else None
+    except:
+        print(f"Usage: python {sys.argv[0]} <svg|export|recipes> [num_samples]")
+        print("Using default values")
+        mode = "svg"
+
     folder = "data/MPEG7"
     imageset = ImageSet(folder)
 
-    generator6 = Generator6(imageset, sample_size=500, target_halfside=5., unit_side=.05)
-    for i in tqdm(range(len(imageset))):
-        sample_matrix, name = generator6.get_sample()
-        grid = HexGrid(sample_matrix)
-        hex_save_svg(grid, f"data/svgs_hex/{name}.svg")
-
-    generator5 = Generator5(imageset, sample_size=500, target_halfside=5., unit_side=.1)
-    for i in tqdm(range(len(imageset))):
-        sample_matrix, name = generator5.get_sample()
-        grid = PenGrid(sample_matrix, from_np=True)
-        pen_save_svg(grid, f"data/svgs_pen/{name}.svg")
\ No newline at end of file
+    generator6 = Generator6(imageset, sample_size=500, target_halfside=5., unit_side=.05, cache_dir="data/cache")
+    generator5 = Generator5(imageset, sample_size=500, target_halfside=5., unit_side=.1, cache_dir="data/cache")
+
+    if mode == "export":
+        from shards import export
+        export(generator6, num_samples, "data/shards_hex")
+        export(generator5, num_samples, "data/shards_pen")
+        sys.exit()
+
+    if mode == "recipes":
+        from recipes import export_recipes
+        export_recipes(generator6, num_samples, "data/recipes_hex.npz")
+        export_recipes(generator5, num_samples, "data/recipes_pen.npz")
+        sys.exit()
+
+    # The svgs are built and written by background threads, into a single tar archive per tiling
+    from functools import partial
+    from sinks import BackgroundWriter, open_sink
+
+    with BackgroundWriter(open_sink("data/svgs_hex.tar")) as writer:
+        for i in tqdm(range(len(imageset))):
+            sample_matrix, name = generator6.get_sample()
+            writer.submit(f"{name}.svg", partial(hex_save_svg, HexArrayGrid(sample_matrix), None, compact=True))
+
+    with BackgroundWriter(open_sink("data/svgs_pen.tar")) as writer:
+        for i in tqdm(range(len(imageset))):
+            sample_matrix, name = generator5.get_sample()
+            writer.submit(f"{name}.svg", partial(pen_save_svg, PenArrayGrid(sample_matrix), None, compact=True))
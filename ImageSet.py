@@ -3,49 +3,96 @@ from PIL import Image
 from pathlib import Path
 from collections import namedtuple
 
-from utils import zealous_crop
+from functools import partial
+
+from utils import zealous_crop, summed_area_table, halve_mask, mask_pyramid
+from mask_archive import build_archive, MaskArchive, ArchiveSamples
+
+Sample = namedtuple("Sample", ["mask", "classid", "on", "classname", "inclassid", "sat", "pyramid"],
+                    defaults=(None, None))
+
+def load_mask(f, max_side=None):
+    """
+    Read a mask image as a 0/1 uint8 array, cropped to its content with a margin of 5 pixels.
+    Masks with a side over max_side are halved (see utils.halve_mask) until they fit.
+    """
+    img = Image.open(f)
+    arr = np.array(img, dtype=np.uint8)
+
+    if False and arr[0,0] + arr[0,-1] + arr[-1,0] + arr[-1,-1] != 0:
+        print(f"{f.name}\t{arr.size:7d}{arr.shape}", end="\t")
+        unique, counts = np.unique(arr, return_counts=True)
+        for val, count in zip(unique, counts):
+            print(f" {val:4d}: {count:7d} ({count/arr.size*100:.2f}%)", end="\t")
+        print("CHECK" if np.sum(arr==0) + np.sum(arr==1)  + np.sum(arr==255) != arr.size else "", end="\t")
+        print(f"Corner pixels: {arr[0,0]} {arr[0,-1]} {arr[-1,0]} {arr[-1,-1]}")
+
+    arr[arr > 0] = 1                   # Some images have values 255 for ON
+    arr = zealous_crop(arr, margin=5)
+    while max_side is not None and max(arr.shape) > max_side:
+        arr = halve_mask(arr)
+    return arr
 
-Sample = namedtuple("Sample", ["mask", "classid", "on", "classname", "inclassid"])
 
 class ImageSet:
-    def __init__(self, folder):
+    def __init__(self, folder, summed_area=False, archive=None, workers=None, max_side=None, pyramid=False):
+        """
+        summed_area: also precompute the summed-area table of each mask (needed for exact coverage).
+        max_side: reduce larger masks to at most this many pixels a side, bounding the memory they take.
+        pyramid: also precompute a mipmap of each mask (see utils.mask_pyramid).
+        archive: optional path of a packed mask archive (see mask_archive). It is built from the folder
+            (decoding in a pool of workers threads) if missing or stale (files added, removed or modified), and then the masks are only
+            unpacked from it on access, instead of all being decoded and held in memory.
+        """
         self.folder = folder
         self.class_name_to_id = dict()
         self.class_id_to_name = dict()
         num_classes = 0
-        self.samples = []
-
-        for f in sorted(Path(folder).glob("*.gif")):
-            img = Image.open(f)
-            arr = np.array(img, dtype=np.uint8)
-
-            if False and arr[0,0] + arr[0,-1] + arr[-1,0] + arr[-1,-1] != 0:
-                print(f"{f.name}\t{arr.size:7d}{arr.shape}", end="\t")
-                unique, counts = np.unique(arr, return_counts=True)
-                for val, count in zip(unique, counts):
-                    print(f" {val:4d}: {count:7d} ({count/arr.size*100:.2f}%)", end="\t")
-                print("CHECK" if np.sum(arr==0) + np.sum(arr==1)  + np.sum(arr==255) != arr.size else "", end="\t")
-                print(f"Corner pixels: {arr[0,0]} {arr[0,-1]} {arr[-1,0]} {arr[-1,-1]}")
+        files = sorted(Path(folder).glob("*.gif"))
 
-            arr[arr > 0] = 1                   # Some images have values 255 for ON
-            arr = zealous_crop(arr, margin=5)
+        if archive is not None:
+            if not MaskArchive.exists(archive) or not MaskArchive(archive).matches(files, max_side):
+                build_archive(files, archive, partial(load_mask, max_side=max_side), workers, max_side)
+            mask_archive = MaskArchive(archive)
+            names = mask_archive.names
+        else:
+            names = [f.stem for f in files]
 
-            class_name, inclassid = f.stem.split("-")
+        classids, classnames, inclassids = [], [], []
+        for name in names:
+            class_name, inclassid = name.split("-")
             if class_name not in self.class_name_to_id:
                 self.class_name_to_id[class_name] = num_classes
                 self.class_id_to_name[num_classes] = class_name
                 num_classes += 1
+            classids.append(self.class_name_to_id[class_name])
+            classnames.append(class_name)
+            inclassids.append(int(inclassid))
 
-            class_id = self.class_name_to_id[class_name]
-            sample = Sample(mask=arr, classid=class_id, on=np.sum(arr), classname=class_name, inclassid=int(inclassid))
-            self.samples.append(sample)
+        if archive is not None:
+            self.samples = ArchiveSamples(mask_archive, Sample, classids, classnames, inclassids)
+        else:
+            self.samples = []
+            for f, class_id, class_name, inclassid in zip(files, classids, classnames, inclassids):
+                arr = load_mask(f, max_side)
+                sample = Sample(mask=arr, classid=class_id, on=np.sum(arr), classname=class_name, inclassid=inclassid)
+                self.samples.append(sample)
 
         self.num_classes = num_classes
+        self.classnames, self.inclassids = classnames, inclassids
+        self.packed_bits = archive is not None        # packed_masks and packed_pyramids hold 8 pixels a byte
+        self._packed = None
+        self._packed_sats = None
+        self._packed_pyramids = None
+        if summed_area:
+            self.add_summed_area_tables()
+        if pyramid:
+            self.add_pyramids()
 
         print(f"Found {len(self.samples)} images")
         print(f"  Num Classes: {self.num_classes}")
         for class_num in range(self.num_classes):
-            print(f"    Class {class_num} {self.class_id_to_name[class_num]}: {len([s for s in self.samples if s.classid == class_num])} samples")
+            print(f"    Class {class_num} {self.class_id_to_name[class_num]}: {classids.count(class_num)} samples")
 
     def __len__(self):
         return len(self.samples)
@@ -57,7 +104,107 @@ class ImageSet:
         for i in range(len(self)):
             yield self.get_random_sample()
 
-    def get_random_sample(self):
-        idx = np.random.randint(0, len(self))
+    def name(self, idx):
+        """ The name (class-inclassid) of sample idx, from the metadata alone so no mask is loaded. """
+        return f"{self.classnames[idx]}-{self.inclassids[idx]:02d}"
+
+    def get_random_sample(self, rng=None):
+        """ rng: an optional np.random.Generator, the global np.random state is used otherwise. """
+        if rng is None:
+            idx = np.random.randint(0, len(self))
+        else:
+            idx = rng.integers(0, len(self))
         return self[idx]
 
+    def mask_sizes(self):
+        """ The (heights, widths, ons) arrays of the masks, without touching the pixels in archive mode. """
+        if isinstance(self.samples, ArchiveSamples):
+            archive = self.samples.archive
+            return archive.heights, archive.widths, archive.ons.astype(float)
+        _, _, heights, widths, ons = self.packed_masks()
+        return heights, widths, ons
+
+    def packed_masks(self):
+        """
+        All the masks raveled into one flat uint8 array, followed by a single 0 pixel
+        that can be used as the target of out of bounds lookups.
+        Returns (flat, offsets, heights, widths, ons), the latter four indexed by sample.
+        In archive mode (packed_bits), flat is the memory-mapped archive itself, 8 pixels a byte, without the
+        trailing 0 pixel, and offsets count bits (see utils.mask_pixels).
+        """
+        if self._packed is None and isinstance(self.samples, ArchiveSamples):
+            archive = self.samples.archive
+            self._packed = archive.data, 8 * archive.offsets, *self.mask_sizes()
+        if self._packed is None:
+            masks = [s.mask for s in self.samples]
+            heights = np.array([m.shape[0] for m in masks], dtype=np.int64)
+            widths = np.array([m.shape[1] for m in masks], dtype=np.int64)
+            sizes = heights * widths
+            offsets = np.cumsum(sizes) - sizes
+            flat = np.zeros(sizes.sum() + 1, dtype=np.uint8)
+            for m, off, size in zip(masks, offsets, sizes):
+                flat[off:off + size] = m.ravel()
+            ons = np.array([m.sum() for m in masks], dtype=float)
+            self._packed = flat, offsets, heights, widths, ons
+        return self._packed
+
+    def add_summed_area_tables(self):
+        """ Compute (once) the summed-area table of each mask, see utils.summed_area_table. """
+        if isinstance(self.samples, ArchiveSamples):
+            self.samples.archive.summed_area_tables()  # Stored in the archive, and mapped from there on access
+            self.samples.summed_area = True
+            return
+        self.samples = [s if s.sat is not None else s._replace(sat=summed_area_table(s.mask))
+                        for s in self.samples]
+
+    def packed_sats(self):
+        """
+        The summed-area tables of all the masks raveled into one flat int32 array.
+        Returns (flat, offsets), offsets indexed by sample.
+        """
+        if self._packed_sats is None and isinstance(self.samples, ArchiveSamples):
+            self.add_summed_area_tables()
+            self._packed_sats = self.samples.archive.summed_area_tables(), self.samples.archive.sat_offsets()
+        if self._packed_sats is None:
+            self.add_summed_area_tables()
+            sats = [s.sat for s in self.samples]
+            sizes = np.array([sat.size for sat in sats], dtype=np.int64)
+            offsets = np.cumsum(sizes) - sizes
+            flat = np.concatenate([sat.ravel() for sat in sats])
+            self._packed_sats = flat, offsets
+        return self._packed_sats
+
+    def add_pyramids(self):
+        """ Compute (once) the mipmap of each mask, see utils.mask_pyramid. """
+        if isinstance(self.samples, ArchiveSamples):
+            self.samples.archive.pyramids()          # Stored in the archive, and unpacked from there on access
+            self.samples.pyramid = True
+            return
+        self.samples = [s if s.pyramid is not None else s._replace(pyramid=mask_pyramid(s.mask))
+                        for s in self.samples]
+
+    def packed_pyramids(self):
+        """
+        All the levels of all the mask pyramids raveled into one flat uint8 array, followed by a single 0 pixel.
+        Returns (flat, offsets, heights, widths, num_levels), the first three (num_samples, max_levels) arrays
+        in which samples with fewer levels repeat their last one.
+        In archive mode (packed_bits), flat holds 8 pixels a byte as in packed_masks.
+        """
+        if self._packed_pyramids is None and isinstance(self.samples, ArchiveSamples):
+            self.add_pyramids()
+            self._packed_pyramids = self.samples.archive.pyramids()
+        if self._packed_pyramids is None:
+            self.add_pyramids()
+            pyramids = [s.pyramid for s in self.samples]
+            num_levels = np.array([len(p) for p in pyramids], dtype=np.int64)
+            levels = [p + p[-1:] * (num_levels.max() - len(p)) for p in pyramids]
+            heights = np.array([[m.shape[0] for m in p] for p in levels], dtype=np.int64)
+            widths = np.array([[m.shape[1] for m in p] for p in levels], dtype=np.int64)
+            sizes = heights * widths
+            offsets = (np.cumsum(sizes.ravel()) - sizes.ravel()).reshape(sizes.shape)
+            flat = np.zeros(sizes.sum() + 1, dtype=np.uint8)
+            for p, offs in zip(levels, offsets):
+                for m, off in zip(p, offs):
+                    flat[off:off + m.size] = m.ravel()
+            self._packed_pyramids = flat, offsets, heights, widths, num_levels
+        return self._packed_pyramids
@@ -0,0 +1,94 @@
+import numpy as np
+
+from raster import polygon_makers
+from pen_base import PenGrid, PenArrayGrid
+from utils import ArrayGrid
+
+
+def tile_matrix(grid):
+    """ The (N, 5) matrix (x, y, color, angle, side) of a PenGrid, HexGrid or ArrayGrid. """
+    if isinstance(grid, ArrayGrid):
+        return grid.matrix
+    return np.array([(t.x, t.y, t.color, t.angle, t.side) for t in grid], dtype=float)
+
+
+def grid_kind(grid):
+    return "pen" if isinstance(grid, (PenGrid, PenArrayGrid)) else "hex"
+
+
+def dense_ids(keys):
+    """ Number the distinct values of an integer array 0, 1, 2, ... in increasing order (np.unique's inverse). """
+    order = np.argsort(keys)
+    ids = np.empty(len(keys), dtype=np.int64)
+    ids[order] = np.concatenate([[0], np.cumsum(np.diff(keys[order]) != 0)])
+    return ids
+
+
+def adjacency(matrix, kind, quantum=1e-3):
+    """
+    Edge sharing neighbours of the tiles of an (N, 5) matrix (a canvas or a get_sample output), in CSR form:
+    the neighbours of tile i are indices[indptr[i]:indptr[i+1]], in increasing order.
+    kind: "pen" or "hex", as for raster.rasterize.
+    Vertices are quantised to integer keys on a grid of quantum × (smallest side), and the tiles sharing
+    an edge are found by sorting the edge keys, so the cost is O(n log n).
+    Rows with side 0 (the padding of short samples) get no neighbours.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    n = len(matrix)
+    tiles = np.flatnonzero(matrix[:, 4] > 0)
+    if len(tiles) == 0:
+        return np.zeros(n + 1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    polys = polygon_makers[kind](matrix[tiles])                     # (m, k, 2)
+    m, k, _ = polys.shape
+    step = quantum * matrix[tiles, 4].min()
+    keys = np.round(polys.reshape(-1, 2) / step).astype(np.int64)
+    keys -= keys.min(axis=0)
+    keys = keys[:, 0] * (int(keys[:, 1].max()) + 1) + keys[:, 1]        # One integer per vertex
+    vertex = dense_ids(keys).reshape(m, k)
+
+    # Each edge as (smaller vertex id, larger vertex id) packed in one integer
+    nv = int(vertex.max()) + 1
+    a, b = vertex, np.roll(vertex, -1, axis=1)
+    edges = (np.minimum(a, b) * nv + np.maximum(a, b)).ravel()
+    owner = np.repeat(tiles, k)
+
+    order = np.argsort(edges, kind="stable")
+    edges, owner = edges[order], owner[order]
+    shared = np.flatnonzero(edges[1:] == edges[:-1])
+    i, j = owner[shared], owner[shared + 1]
+    rows, cols = np.concatenate([i, j]), np.concatenate([j, i])
+
+    # Drop repeats (two tiles can only share one edge, but be safe with degenerate input)
+    pairs = np.sort(rows * n + cols)
+    pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])]
+    rows, cols = np.divmod(pairs, n)
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))])
+    return indptr, cols
+
+
+def grid_adjacency(grid, quantum=1e-3):
+    """ adjacency for a PenGrid, HexGrid or ArrayGrid. """
+    return adjacency(tile_matrix(grid), grid_kind(grid), quantum)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from pen_pregen import get_pen_mother_tiles
+    from hex_pregen import get_hex_mother_arrays
+
+    try:
+        halfside = float(sys.argv[1])
+    except:
+        print(f"Usage: python {sys.argv[0]} <halfside>")
+        print("Using default values")
+        halfside = 5.
+
+    for kind, canvas in (("pen", tile_matrix(get_pen_mother_tiles(halfside, .1))),
+                         ("hex", get_hex_mother_arrays(halfside, .05))):
+        t0 = time.perf_counter()
+        indptr, indices = adjacency(canvas, kind)
+        degrees = np.bincount(np.diff(indptr))
+        print(f"{kind}: {len(canvas)} tiles {len(indices) // 2} edges in {time.perf_counter() - t0:.3f}s"
+              f"  degrees: {dict(enumerate(degrees.tolist()))}")
@@ -0,0 +1,152 @@
+import io
+import sys
+import copy
+import json
+import time
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from pen_base import PenGrid, PenArrayGrid
+from pen_shapes import circle_tiling
+from pen_pregen import get_pen_mother_tiles
+from hex_pregen import get_hex_mother_tiles
+from pen_svg import save_svg as pen_save_svg
+from hex_svg import save_svg as hex_save_svg
+from ImageSet import ImageSet
+from Generator import Generator5, Generator6
+
+# Sizes of each stage: inflation levels, canvas halfsides, mask sides (pixels) and number of samples/masks
+SIZES = {
+    "quick": dict(levels=(4, 6, 8), halfsides=(2., 4.), masks=(32, 64), samples=20, num_masks=8),
+    "full": dict(levels=(6, 8, 10, 12), halfsides=(2., 4., 8., 16.), masks=(32, 64, 128, 256), samples=200,
+                 num_masks=64),
+}
+
+
+def measure(fn, repeat=3):
+    """
+    Best wall time of fn() over repeat runs, and the peak memory (bytes) of one more run under tracemalloc.
+    Everything fn prints is swallowed. Returns (result, seconds, peak).
+    """
+    seconds = float("inf")
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = fn()
+            seconds = min(seconds, time.perf_counter() - t0)
+            del result
+
+        tracemalloc.start()
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def disc_masks(folder, side, count, seed=0):
+    """ Write count GIF masks (side × side) of random ellipses as <folder>/disc<side>-<i>.gif """
+    rng = np.random.default_rng(seed)
+    u, v = np.mgrid[:side, :side] / side - .5
+    for i in range(count):
+        a, b = rng.uniform(.2, .45, 2)
+        mask = (u / a) ** 2 + (v / b) ** 2 <= 1
+        Image.fromarray(mask.astype(np.uint8) * 255).save(Path(folder) / f"disc{side}-{i + 1}.gif")
+
+
+def mask_pixels(imageset):
+    return int(sum(s.mask.size for s in imageset.samples))
+
+
+def run(sizes, folder=None, repeat=3):
+    """
+    Time the stages of the pipeline at each of the sizes, returns a list of records:
+        stage, size, tiles, seconds (best of repeat), tiles_per_second, peak_bytes
+    For the ImageSet stages the "tiles" are the pixels of the (cropped) masks.
+    folder: the mask images for the ImageSet stage, synthetic masks are used if None.
+    """
+    records = []
+
+    def record(stage, size, fn, count, repeat=repeat):
+        result, seconds, peak = measure(fn, repeat)
+        tiles = count(result)
+        records.append(dict(stage=stage, size=size, tiles=tiles, seconds=seconds,
+                            tiles_per_second=tiles / seconds if seconds > 0 else None, peak_bytes=peak))
+        print(f"{stage:>20s} {str(size):>8s} {tiles:9d} tiles {seconds:9.4f}s {peak / 2**20:9.1f}MiB")
+        return result
+
+    for level in sizes["levels"]:
+        def inflate():
+            grid = copy.deepcopy(circle_tiling)
+            grid.inflate(level)
+            return grid
+        grid = record("inflate", level, inflate, len)
+        record("pengrid", level, lambda: PenGrid(grid), len)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for halfside in sizes["halfsides"]:
+            pen = record("pen_mother_tiles", halfside, lambda: get_pen_mother_tiles(halfside, .1), len, 1)
+            hexes = record("hex_mother_tiles", halfside, lambda: get_hex_mother_tiles(halfside, .05), len, 1)
+            record("pen_save_svg", halfside, lambda: pen_save_svg(pen, f"{tmp}/pen.svg"), lambda _: len(pen))
+            record("hex_save_svg", halfside, lambda: hex_save_svg(hexes, f"{tmp}/hex.svg"), lambda _: len(hexes))
+
+        for side in sizes["masks"]:
+            masks = Path(tmp) / f"masks{side}"
+            masks.mkdir()
+            disc_masks(masks, side, sizes["num_masks"])
+            imageset = record("imageset", side, lambda: ImageSet(masks), mask_pixels)
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                generators = (Generator5(imageset, 500, 8., .1), Generator6(imageset, 500, 8., .05))
+            for generator in generators:
+                def samples():
+                    rng = np.random.default_rng(0)
+                    return [generator.get_sample(rng)[0] for _ in range(sizes["samples"])]
+                record(f"get_sample_{generator.kind}", side, samples,
+                       lambda s: int(sum((m[:, 4] > 0).sum() for m in s)))
+
+            # All the Penrose samples as one sample matrix
+            rng = np.random.default_rng(0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                matrix = np.concatenate([generators[0].get_sample(rng)[0] for _ in range(sizes["samples"])])
+            record("array_save_svg", side, lambda: pen_save_svg(PenArrayGrid(matrix), f"{tmp}/array.svg"),
+                   lambda _: len(matrix))
+
+        if folder is not None:
+            record("imageset_folder", Path(folder).name, lambda: ImageSet(folder), mask_pixels, 1)
+
+    return records
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).parent).stdout.strip() or None
+    except OSError:
+        commit = None
+    return dict(commit=commit, python=platform.python_version(), numpy=np.__version__,
+                machine=platform.machine(), processor=platform.processor())
+
+
+if __name__ == '__main__':
+    try:
+        preset = sys.argv[1]
+        output = sys.argv[2]
+        folder = sys.argv[3] if len(sys.argv) > 3 else None
+        sizes = SIZES[preset]
+    except:
+        print(f"Usage: python {sys.argv[0]} <quick|full> <output.json> [mask_folder]")
+        print("Using default values")
+        preset, output, folder = "quick", "benchmark.json", None
+        sizes = SIZES[preset]
+
+    records = run(sizes, folder)
+    with open(output, "w") as f:
+        json.dump(dict(environment(), preset=preset, results=records), f, indent=1)
+    print(f"Saved {len(records)} results to {output}")
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+CODE_VERSION = 4                  # Bump whenever the mother tile generation changes its output
+COLUMNS = ("xy", "color", "angle", "side")
+
+
+def cache_path(cache_dir, kind, target_halfside, unit_side):
+    """ Folder holding the canvas columns for the given key. """
+    return Path(cache_dir) / f"{kind}_{float(target_halfside)!r}_{float(unit_side)!r}_v{CODE_VERSION}"
+
+
+def save_canvas(cache_dir, kind, target_halfside, unit_side, columns):
+    """
+    Store the canvas as one .npy file per column.
+    columns: dict with arrays for each of xy (the (N, 2) centers, kept together so they map as one array),
+        color, angle, side
+    """
+    path = cache_path(cache_dir, kind, target_halfside, unit_side)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = Path(tempfile.mkdtemp(dir=path.parent, prefix=f".{path.name}."))
+    for name in COLUMNS:
+        np.save(tmp / f"{name}.npy", np.asarray(columns[name]))
+
+    try:
+        os.rename(tmp, path)                 # Atomic, so concurrent jobs never see half-written canvases
+    except OSError:
+        shutil.rmtree(tmp)                   # Another job got there first
+    return path
+
+
+def load_canvas(cache_dir, kind, target_halfside, unit_side):
+    """
+    Memory-map the cached columns. Returns a dict of arrays or None if not cached.
+    """
+    path = cache_path(cache_dir, kind, target_halfside, unit_side)
+    if not all((path / f"{name}.npy").exists() for name in COLUMNS):
+        return None
+    return {name: np.load(path / f"{name}.npy", mmap_mode="r") for name in COLUMNS}
+
+
+def save_extra(cache_dir, kind, target_halfside, unit_side, name, arrays):
+    """
+    Store arrays derived from a cached canvas (e.g. its adjacency) as <name>.npz in the canvas folder.
+    """
+    path = cache_path(cache_dir, kind, target_halfside, unit_side)
+    path.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path, prefix=f".{name}.", suffix=".npz")
+    with os.fdopen(fd, "wb") as fo:
+        np.savez(fo, **arrays)
+    os.replace(tmp, path / f"{name}.npz")
+    return path / f"{name}.npz"
+
+
+def load_extra(cache_dir, kind, target_halfside, unit_side, name):
+    """ The arrays stored by save_extra as a dict, or None if not cached. """
+    path = cache_path(cache_dir, kind, target_halfside, unit_side) / f"{name}.npz"
+    if not path.exists():
+        return None
+    with np.load(path) as data:
+        return dict(data)
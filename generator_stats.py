@@ -0,0 +1,107 @@
+import time
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class GeneratorStats:
+    """
+    Running counters of a Generator, see Generator.enable_stats.
+        samples: number of samples drawn
+        shortfalls: samples with fewer than sample_size tiles on the mask (padded with zeros)
+        low_coverage: samples that needed tiles with coverage 1 (the diagnostics printout of get_sample)
+        coverage: histogram of the coverage levels 0..4 of all the tiles near the windows
+        scaling: count, sum, min, max of the mask to canvas scaling, per class
+        seconds: time spent in each stage
+    If log_every is given, a summary is logged (with log, default logging info) every so many samples.
+    Safe to share between threads (as with Prefetcher threads): each thread times its own stages,
+    and the seconds add up over the threads. Forked worker processes count in their own copies.
+    """
+    STAGES = ("tiles", "rotate", "coverage", "selection")
+
+    def __init__(self, sample_size, log_every=None, log=None):
+        self.sample_size = sample_size
+        self.log_every = log_every
+        self.log = logger.info if log is None else log
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self.samples = 0
+        self.shortfalls = 0
+        self.low_coverage = 0
+        self.coverage = np.zeros(5, dtype=np.int64)
+        self.scaling = {}
+        self.seconds = dict.fromkeys(self.STAGES, 0.)
+        self._last_logged = 0
+        self._local = threading.local()      # Time of the last start/lap of each thread
+
+    def start(self):
+        self._local.t = time.perf_counter()
+
+    def lap(self, stage):
+        """ Charge the time since the last start/lap of this thread to stage. """
+        t = time.perf_counter()
+        elapsed = t - getattr(self._local, "t", t)
+        self._local.t = t
+        with self._lock:
+            self.seconds[stage] += elapsed
+
+    def add(self, counts, classnames, scalings):
+        """
+        counts: (n, 5) number of tiles at each coverage level, one row per sample
+        classnames, scalings: of each of the n samples
+        """
+        counts = np.asarray(counts)
+        summary = None
+        with self._lock:
+            self.coverage += counts.sum(axis=0)
+            self.samples += len(counts)
+            self.shortfalls += int((counts[:, 1:].sum(axis=1) < self.sample_size).sum())
+            self.low_coverage += int((counts[:, 2:].sum(axis=1) < self.sample_size).sum())
+            for name, s in zip(classnames, np.asarray(scalings).tolist()):
+                n, total, lo, hi = self.scaling.get(name, (0, 0., s, s))
+                self.scaling[name] = (n + 1, total + s, min(lo, s), max(hi, s))
+
+            if self.log_every and self.samples - self._last_logged >= self.log_every:
+                self._last_logged = self.samples
+                summary = self._summary()
+        if summary is not None:
+            self.log(summary)
+
+    def snapshot(self):
+        """ The stats as a dict of plain python values. """
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        n = max(self.samples, 1)
+        return dict(
+            samples=self.samples,
+            shortfalls=self.shortfalls,
+            shortfall_rate=self.shortfalls / n,
+            low_coverage=self.low_coverage,
+            low_coverage_rate=self.low_coverage / n,
+            coverage_histogram=self.coverage.tolist(),
+            seconds=dict(self.seconds),
+            seconds_per_sample={k: v / n for k, v in self.seconds.items()},
+            scaling={name: dict(count=c, mean=total / c, min=lo, max=hi)
+                     for name, (c, total, lo, hi) in sorted(self.scaling.items())},
+        )
+
+    def summary(self):
+        """ One line summary for the periodic log. """
+        with self._lock:
+            return self._summary()
+
+    def _summary(self):
+        n = max(self.samples, 1)
+        times = " ".join(f"{k}={v / n * 1e3:.2f}ms" for k, v in self.seconds.items())
+        return (f"samples={self.samples} shortfall={self.shortfalls / n:.1%} low_coverage={self.low_coverage / n:.1%}"
+                f" coverage={self.coverage.tolist()} {times}")
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+class GridIndex:
+    """
+    Uniform grid of buckets over a set of 2D points, for fast range queries.
+    Points are bucketed by cell and stored in CSR form: the indices of the points in cell k are
+    order[starts[k]:starts[k+1]], in increasing order.
+    """
+    def __init__(self, xy, cell_size):
+        xy = np.asarray(xy, dtype=float)
+        self.xy = xy
+        self.cell_size = cell_size
+        self.origin = xy.min(axis=0)
+        ij = np.floor((xy - self.origin) / cell_size).astype(np.int64)
+        self.nx, self.ny = ij.max(axis=0) + 1
+        cell = ij[:, 0] * self.ny + ij[:, 1]
+        self.order = np.argsort(cell, kind='stable')
+        self.starts = np.searchsorted(cell[self.order], np.arange(self.nx * self.ny + 1))
+
+    def query_box(self, xmin, ymin, xmax, ymax):
+        """ Sorted indices of the points in all the cells overlapping the box (a superset of the points in it). """
+        i0, j0 = np.floor((np.array([xmin, ymin]) - self.origin) / self.cell_size).astype(np.int64)
+        i1, j1 = np.floor((np.array([xmax, ymax]) - self.origin) / self.cell_size).astype(np.int64)
+        i0, i1 = max(i0, 0), min(i1, self.nx - 1)
+        j0, j1 = max(j0, 0), min(j1, self.ny - 1)
+        if i0 > i1 or j0 > j1:
+            return np.empty(0, dtype=np.int64)
+
+        # Cells j0..j1 of a row are contiguous in the CSR layout
+        rows = np.arange(i0, i1 + 1) * self.ny
+        idx = np.concatenate([self.order[self.starts[r + j0]:self.starts[r + j1 + 1]] for r in rows])
+        idx.sort()
+        return idx
+
+    def query_disc(self, cx, cy, r):
+        """ Sorted indices of the points within distance r of (cx, cy). """
+        idx = self.query_box(cx - r, cy - r, cx + r, cy + r)
+        d = self.xy[idx] - (cx, cy)
+        return idx[(d * d).sum(axis=1) <= r * r]
+
+    def query_discs(self, cx, cy, r):
+        """
+        query_disc for arrays of discs at once, in CSR form (indptr, indices):
+        the points within disc k are indices[indptr[k]:indptr[k+1]], in increasing order.
+        """
+        cx, cy, r = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (cx, cy, r)))
+        m = len(cx)
+        i0, j0 = (np.floor((c - r - o) / self.cell_size).astype(np.int64) for c, o in zip((cx, cy), self.origin))
+        i1, j1 = (np.floor((c + r - o) / self.cell_size).astype(np.int64) for c, o in zip((cx, cy), self.origin))
+        i0, i1 = np.maximum(i0, 0), np.minimum(i1, self.nx - 1)
+        j0, j1 = np.maximum(j0, 0), np.minimum(j1, self.ny - 1)
+        rows = np.where((i0 <= i1) & (j0 <= j1), i1 - i0 + 1, 0)
+
+        # Cells j0..j1 of each row of each box are one contiguous run of the CSR layout
+        box = np.repeat(np.arange(m), rows)
+        row = i0[box] + np.arange(len(box)) - np.repeat(np.cumsum(rows) - rows, rows)
+        lo = self.starts[row * self.ny + j0[box]]
+        counts = self.starts[row * self.ny + j1[box] + 1] - lo
+        owner = np.repeat(box, counts)
+        idx = self.order[np.repeat(lo - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())]
+
+        d = self.xy[idx] - np.stack([cx[owner], cy[owner]], axis=1)
+        inside = (d * d).sum(axis=1) <= r[owner] ** 2
+        owner, idx = owner[inside], idx[inside]
+
+        # Owners are already grouped in order, sort the indices within each group
+        key = owner * len(self) + idx
+        key.sort()
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(owner, minlength=m))])
+        return indptr, key - owner * len(self)
+
+    def __len__(self):
+        return len(self.xy)
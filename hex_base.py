@@ -1,5 +1,7 @@
 import math
-from utils import inscribed_square_halfside
+import numpy as np
+from collections import namedtuple
+from utils import ArrayGrid
 
 def get_color(q, r, s):
     """
@@ -64,7 +66,47 @@ def get_hex_ring(degree):
         for step in range(degree):
             hexes.append(hexes[-1] + direction)
     
-    return hexes
+    return hexes[:-1] if degree else hexes      # The walk ends back at the first hex
+
+
+def hex_lattice(max_degree):
+    """
+    Axial coordinates (q, r) of all the hexes of the rings 0..max_degree-1,
+    in the same order as HexagonGrid.from_degree lists them, as two int arrays.
+    """
+    counts = np.maximum(6 * np.arange(max_degree), 1)
+    degrees = np.repeat(np.arange(max_degree), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)        # Position within the ring
+    leg, step = np.divmod(k, np.maximum(degrees, 1))
+
+    # The walk starts at degree * (0, -1), goes along directions[leg] and each leg starts at the sum of the earlier ones
+    dirs = np.array([d[:2] for d in directions])
+    corners = np.concatenate([[(0, -1)], (0, -1) + np.cumsum(dirs, axis=0)])
+    qr = degrees[:, None] * corners[leg] + step[:, None] * dirs[leg]
+    return qr[:, 0], qr[:, 1]
+
+
+def hex_colors(q, r):
+    """ get_color for arrays of axial coordinates. """
+    cube = np.abs(np.stack([q, r, -q - r]))
+    return ((cube.max(axis=0) + cube.min(axis=0)) % 3 == 0).astype(int)
+
+
+def hex_centers(q, r, side=1.):
+    """ Hexagon.center for arrays of axial coordinates, as an (N, 2) array. """
+    return np.stack([side * (math.sqrt(3) * q + math.sqrt(3) / 2 * r), side * (3 / 2 * r)], axis=1)
+
+
+def degree_for_halfside(target_hexside, target_halfside):
+    """
+    Number of rings for the grid of hexes with side target_hexside to cover the square of half size target_halfside.
+    The centers of the rings 0..D-1 fill a hexagon with the (D-1) multiples of the ring 1 centers as corners,
+    so the inscribed square (see inscribed_square_halfside) grows linearly with D.
+    """
+    q, r = hex_lattice(2)
+    xy = hex_centers(q[1:], r[1:])
+    per_ring = min((xy @ np.array([[1, 1, -1, -1], [1, -1, 1, -1]])).max(axis=0)) / 2
+    return max(math.ceil(target_halfside / target_hexside / per_ring), 0) + 1
 
 class HexagonGrid:
     @classmethod
@@ -89,14 +131,7 @@ class HexagonGrid:
         Generate hexagons that cover a square of half size 'total_halfside'.
         With hexagons with side 'hex_side'.
         """
-        degree = 0
-        all_hexes = get_hex_ring(degree)
-        unscaled_halfside = target_halfside * all_hexes[0].side / target_hexside
-        
-        while inscribed_square_halfside(all_hexes) < unscaled_halfside:
-            degree += 1
-            all_hexes.extend(get_hex_ring(degree))
-        return cls(all_hexes)
+        return cls.from_degree(degree_for_halfside(target_hexside, target_halfside))
 
     def __init__(self, hexes):
         self.hexes = hexes
@@ -108,6 +143,8 @@ class HexagonGrid:
         return len(self.hexes)
 
 class HexXYA:
+    __slots__ = ('x', 'y', 'color', 'angle', 'side')
+
     def __init__(self, hexagon):
         self.x, self.y = hexagon.center
         self.color = hexagon.color
@@ -142,8 +179,7 @@ class HexXYA:
     def __str__(self) -> str:
         return f"HexXYA {self.x:7.2f} {self.y:7.2f} {self.angle:7.2f} ({math.degrees(self.angle):+3.0f}) {self.color} {self.side:.1f}"
 
-import numpy as np
-from collections import namedtuple
+HexTuple = namedtuple('HexTuple', ['center', 'color', 'angle', 'side'])
 
 class HexGrid:
     def __init__(self, hexagons):
@@ -157,8 +193,7 @@ class HexGrid:
             else:
                 raise ValueError(f"Type of list elements not supported: {type(hexagons[0])}")
         elif isinstance(hexagons, np.ndarray):
-            hextuple = namedtuple('hextuple', ['center', 'color', 'angle', 'side'])
-            self.hexxyas = [HexXYA(hextuple((h[0], h[1]), h[2], h[3], h[4])) for h in hexagons]
+            self.hexxyas = [HexXYA(HexTuple((h[0], h[1]), h[2], h[3], h[4])) for h in hexagons]
         else:
             raise ValueError(f"Type of hexagons not supported: {type(hexagons)}")
 
@@ -182,4 +217,12 @@ class HexGrid:
     
     @property
     def side(self):
-        return self.hexxyas[0].side   
\ No newline at end of file
+        return self.hexxyas[0].side   
+
+class HexArrayGrid(ArrayGrid):
+    """
+    HexGrid over an (N, 5) Generator6 sample matrix (x, y, color, angle, side).
+    """
+    def tile(self, i):
+        x, y, color, angle, side = self.matrix[i].tolist()
+        return HexXYA(HexTuple((x, y), color, angle, side))
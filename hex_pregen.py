@@ -1,5 +1,7 @@
 
-from hex_base import HexagonGrid, HexGrid
+import numpy as np
+
+from hex_base import HexagonGrid, HexGrid, hex_lattice, hex_colors, hex_centers, degree_for_halfside
 from utils import print_tile_stats, inscribed_square_halfside
 
 def get_hex_mother_tiles(total_halfside, target_hex_side):
@@ -13,6 +15,17 @@ def get_hex_mother_tiles(total_halfside, target_hex_side):
     inscribed_square_halfside(hexgrid)
     return hexgrid
 
+def get_hex_mother_arrays(total_halfside, target_hex_side):
+    """
+    Same tiles as get_hex_mother_tiles, straight from the closed form lattice,
+    as an (N, 5) array of (x, y, color, angle, side).
+    """
+    q, r = hex_lattice(degree_for_halfside(target_hex_side, total_halfside))
+    xy = hex_centers(q, r) * (target_hex_side / 1.)
+    tiles = np.column_stack([xy, hex_colors(q, r), np.zeros(len(q)), np.full(len(q), target_hex_side / 1.)])
+    print(f"Hex tiles: {len(tiles)}")
+    return tiles
+
 if __name__ == '__main__':
     import sys
     try:
@@ -1,7 +1,42 @@
-import copy
-from utils import svg_path
+import math
+import numpy as np
+from hex_base import HexArrayGrid
+from utils import svg_polygons_compact
 
-def save_svg(hexgird, filename, target_side=20):
+
+def hexagon_arrays(hexgrid):
+    """
+    The hexagons of hexgrid as arrays: x, y, angles, sides and colors.
+    """
+    if isinstance(hexgrid, HexArrayGrid):
+        return (hexgrid.x.astype(float), hexgrid.y.astype(float), hexgrid.angles.astype(float),
+                hexgrid.sides.astype(float), hexgrid.colors.tolist())
+    hexes = list(hexgrid)
+    x = np.array([h.x for h in hexes], dtype=float)
+    y = np.array([h.y for h in hexes], dtype=float)
+    angle = np.array([h.angle for h in hexes], dtype=float)
+    side = np.array([h.side for h in hexes], dtype=float)
+    colors = [h.color for h in hexes]
+    return x, y, angle, side, colors
+
+
+def hexagon_vertices(x, y, angle, side):
+    """
+    (N, 6) arrays with the first and second coordinates of the vertices of all the hexagons (as in HexXYA.vertices).
+    """
+    anglei = np.array([math.pi / 3 * i - math.pi / 6 for i in range(6)])
+    angles = (anglei + angle[:, None]).ravel().tolist()
+    # Use libm cos and sin as in Hexagon, numpy's own (SIMD) versions can differ in the last bit
+    cos = np.array([math.cos(a) for a in angles]).reshape(-1, 6)
+    sin = np.array([math.sin(a) for a in angles]).reshape(-1, 6)
+    vx = 0.0 + side[:, None] * cos + x[:, None]
+    vy = 0.0 + side[:, None] * sin + y[:, None]
+    return vx, vy
+
+def save_svg(hexgird, filename, target_side=20, compact=False):
+    """
+    compact: draw all the hexagons of a colour as one path, in relative coordinates, with the colours as CSS classes.
+    """
     # Color palette
     config = {
     "colors": {
@@ -14,22 +49,20 @@ def save_svg(hexgird, filename, target_side=20):
     "base-stroke-width": 1,
     }
 
+    x, y, angle, side, colors = hexagon_arrays(hexgird)
+
     # Scale to target side
     orig_side = hexgird.side
     if not (.5 < orig_side/target_side < 1.5):
         scale_factor = target_side / orig_side
-        hexgird = copy.deepcopy(hexgird)
-        hexgird.scale(scale_factor)
+        x, y, side = x * scale_factor, y * scale_factor, side * scale_factor
+
+    # Vertices are (y, x) in image convention
+    vy, vx = hexagon_vertices(x, y, angle, side)
 
     # Determine viewbox size
-    xmin = ymin = float('inf')
-    xmax = ymax = float('-inf')
-    for t in hexgird:
-        for y, x in t.vertices:
-            xmin = min(xmin, x)
-            xmax = max(xmax, x)
-            ymin = min(ymin, y)
-            ymax = max(ymax, y)
+    xmin, xmax = float(vx.min()), float(vx.max())
+    ymin, ymax = float(vy.min()), float(vy.max())
 
     wd, ht = xmax-xmin, ymax-ymin
     m = config['margin']
@@ -47,18 +80,27 @@ def save_svg(hexgird, filename, target_side=20):
     ]
 
     # Draw hexagons
-    for h in hexgird:
-        fill_color = config["colors"].get(h.color, '#94a3b8')
-
-        # Draw hexagon
-        path = svg_path(h)
-        svg.append(f'<path fill="{fill_color}" d="{path}" />')
+    xs, ys = np.round(vx).astype(int), np.round(vy).astype(int)
+    fills = [config["colors"].get(color, '#94a3b8') for color in colors]
+    if compact:
+        palette = list(dict.fromkeys(list(config["colors"].values()) + ['#94a3b8']))
+        fills = np.array([palette.index(f) for f in fills], dtype=int)
+        svg.insert(2, '<style>' + ' '.join(f'.c{i}{{fill:{f}}}' for i, f in enumerate(palette)) + '</style>')
+        for i in range(len(palette)):
+            if (fills == i).any():
+                svg.append(f'<path class="c{i}" d="{svg_polygons_compact(xs[fills == i], ys[fills == i])}"/>')
+    else:
+        xy = np.stack([xs, ys], axis=2).reshape(len(vx), -1).tolist()
+        for fill_color, p in zip(fills, xy):
+            path = f"M{p[0]},{p[1]} L{p[2]},{p[3]} L{p[4]},{p[5]} L{p[6]},{p[7]} L{p[8]},{p[9]} L{p[10]},{p[11]} Z"
+            svg.append(f'<path fill="{fill_color}" d="{path}" />')
 
     svg.append('</g>\n</svg>')
 
     svg = '\n'.join(svg)
-    with open(filename, 'w') as f:
-        f.write(svg)
+    if filename is not None:
+        with open(filename, 'w') as f:
+            f.write(svg)
 
     # print(f"Saved SVG to {filename}.")
     return svg
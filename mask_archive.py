@@ -0,0 +1,202 @@
+import os
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils import summed_area_table, mask_pyramid
+
+
+EXTRAS = ("sats.npy", "pyramids.bin", "pyramids.npz")
+
+
+def file_stamps(files):
+    """ (N, 2) int64 array of the modification time (ns) and size of each file, to tell when it changed. """
+    stats = [os.stat(f) for f in files]
+    return np.array([(st.st_mtime_ns, st.st_size) for st in stats], dtype=np.int64).reshape(-1, 2)
+
+
+def build_archive(files, path, load_mask, workers=None, max_side=None):
+    """
+    Decode and crop the masks of files in a thread pool (load_mask(file) -> 2D 0/1 uint8 array),
+    and write them as packed bits into one archive.
+        <path>/masks.bin: the packed masks back to back
+        <path>/index.npz: offset (in bytes), height, width, on, name and file_stamps of each mask,
+            and the max_side load_mask reduced them to (-1 for None)
+    The summed-area tables and pyramids of an older archive at path are removed, see MaskArchive.
+    """
+    files = list(files)
+    stamps = file_stamps(files)                         # Before reading, so later edits make the archive stale
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for name in EXTRAS:
+        (path / name).unlink(missing_ok=True)
+
+    offsets, heights, widths, ons = [], [], [], []
+    offset = 0
+    with ThreadPoolExecutor(workers) as pool, open(path / "masks.bin.tmp", "wb") as fo:
+        for arr in pool.map(load_mask, files):          # map keeps the order of files
+            packed = np.packbits(arr, axis=None)
+            fo.write(packed.tobytes())
+            offsets.append(offset)
+            heights.append(arr.shape[0])
+            widths.append(arr.shape[1])
+            ons.append(int(arr.sum()))
+            offset += packed.size
+
+    with open(path / "index.npz.tmp", "wb") as fo:
+        np.savez(fo, offset=np.array(offsets, dtype=np.int64), height=np.array(heights, dtype=np.int64),
+                 width=np.array(widths, dtype=np.int64), on=np.array(ons, dtype=np.int64),
+                 name=np.array([Path(f).stem for f in files]), stamp=stamps,
+                 max_side=-1 if max_side is None else max_side)
+    os.replace(path / "masks.bin.tmp", path / "masks.bin")
+    os.replace(path / "index.npz.tmp", path / "index.npz")
+
+
+class MaskArchive:
+    """
+    Read side of build_archive: the masks are memory-mapped and unpacked on access.
+    The summed-area tables and pyramids are computed once, on first request, into the archive folder
+        <path>/sats.npy: all the summed-area tables raveled back to back (int32)
+        <path>/pyramids.bin: all the levels of all the mask pyramids as packed bits, each level starting on a byte
+        <path>/pyramids.npz: offset (in bits), height and width of each level, as in ImageSet.packed_pyramids
+    and memory-mapped from there.
+    """
+    def __init__(self, path):
+        path = Path(path)
+        index = np.load(path / "index.npz")
+        self.offsets = index["offset"]
+        self.heights = index["height"]
+        self.widths = index["width"]
+        self.ons = index["on"]
+        self.names = [str(n) for n in index["name"]]
+        max_side = int(index["max_side"]) if "max_side" in index else -1
+        self.max_side = None if max_side < 0 else max_side
+        self.stamps = index["stamp"] if "stamp" in index else None
+        size = (path / "masks.bin").stat().st_size
+        self.data = np.memmap(path / "masks.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+        self.path = path
+        self._sats = self._pyramids = None
+
+    @staticmethod
+    def exists(path):
+        return (Path(path) / "index.npz").exists() and (Path(path) / "masks.bin").exists()
+
+    def matches(self, files, max_side):
+        """ Whether the archive was built from files as they are now, with the same max_side. """
+        return (self.names == [Path(f).stem for f in files] and self.max_side == max_side
+                and self.stamps is not None and np.array_equal(self.stamps, file_stamps(files)))
+
+    def mask(self, i):
+        H, W, off = int(self.heights[i]), int(self.widths[i]), int(self.offsets[i])
+        nbytes = (H * W + 7) // 8
+        return np.unpackbits(self.data[off:off + nbytes], count=H * W).reshape(H, W)
+
+    def sat_offsets(self):
+        """ Where the summed-area table of each mask starts in summed_area_tables(). """
+        sizes = (self.heights + 1) * (self.widths + 1)
+        return np.cumsum(sizes) - sizes
+
+    def summed_area_tables(self):
+        """ The memory-mapped flat int32 array of the summed-area tables of all the masks (see sat_offsets). """
+        if self._sats is None:
+            path = self.path / "sats.npy"
+            if not path.exists():
+                offsets = self.sat_offsets()
+                tmp = path.with_name(".sats.npy.tmp")
+                sats = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.int32,
+                                                 shape=(int((self.heights + 1) @ (self.widths + 1)),))
+                for i, off in enumerate(offsets):
+                    sat = summed_area_table(self.mask(i))
+                    sats[off:off + sat.size] = sat.ravel()
+                sats.flush()
+                del sats
+                os.replace(tmp, path)
+            self._sats = np.load(path, mmap_mode="r")
+        return self._sats
+
+    def sat(self, i):
+        H, W, off = int(self.heights[i]), int(self.widths[i]), int(self.sat_offsets()[i])
+        return self.summed_area_tables()[off:off + (H + 1) * (W + 1)].reshape(H + 1, W + 1)
+
+    def pyramids(self):
+        """
+        The mask pyramids (see utils.mask_pyramid) as (bits, offsets, heights, widths, num_levels):
+        the memory-mapped packed bits, and (num_masks, max_levels) arrays of the bit offsets and sizes
+        of each level, in which masks with fewer levels repeat their last one.
+        """
+        if self._pyramids is None:
+            if not (self.path / "pyramids.npz").exists():
+                self._build_pyramids()
+            index = np.load(self.path / "pyramids.npz")
+            size = (self.path / "pyramids.bin").stat().st_size
+            bits = np.memmap(self.path / "pyramids.bin", dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+            self._pyramids = bits, index["offset"], index["height"], index["width"], index["num_levels"]
+        return self._pyramids
+
+    def _build_pyramids(self):
+        num_levels = np.zeros(len(self), dtype=np.int64)
+        offsets, heights, widths = [], [], []
+        offset = 0
+        with open(self.path / "pyramids.bin.tmp", "wb") as fo:
+            for i in range(len(self)):
+                pyramid = mask_pyramid(self.mask(i))
+                num_levels[i] = len(pyramid)
+                offsets.append([]), heights.append([]), widths.append([])
+                for m in pyramid:
+                    packed = np.packbits(m, axis=None)
+                    fo.write(packed.tobytes())
+                    offsets[i].append(8 * offset)
+                    heights[i].append(m.shape[0])
+                    widths[i].append(m.shape[1])
+                    offset += packed.size
+
+        # Pad to (num_masks, max_levels) by repeating the last level
+        max_levels = int(num_levels.max(initial=1))
+        pad = lambda rows: np.array([r + r[-1:] * (max_levels - len(r)) for r in rows],
+                                    dtype=np.int64).reshape(-1, max_levels)
+        with open(self.path / "pyramids.npz.tmp", "wb") as fo:
+            np.savez(fo, offset=pad(offsets), height=pad(heights), width=pad(widths), num_levels=num_levels)
+        os.replace(self.path / "pyramids.bin.tmp", self.path / "pyramids.bin")
+        os.replace(self.path / "pyramids.npz.tmp", self.path / "pyramids.npz")
+
+    def pyramid(self, i, start=0):
+        """ Levels start, start + 1, ... of the pyramid of mask i. """
+        bits, offsets, heights, widths, num_levels = self.pyramids()
+        levels = slice(start, int(num_levels[i]))
+        shapes = zip(offsets[i, levels].tolist(), heights[i, levels].tolist(), widths[i, levels].tolist())
+        return [np.unpackbits(bits[off // 8:off // 8 + (H * W + 7) // 8], count=H * W).reshape(H, W)
+                for off, H, W in shapes]
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+class ArchiveSamples:
+    """
+    A read-only list of ImageSet Samples whose masks live in a MaskArchive.
+    Each Sample is materialised on access, with its summed-area table if summed_area is set
+    and its mipmap if pyramid is set, both memory-mapped from the archive rather than recomputed.
+    """
+    def __init__(self, archive, sample_type, classids, classnames, inclassids):
+        self.archive = archive
+        self.sample_type = sample_type
+        self.classids = classids
+        self.classnames = classnames
+        self.inclassids = inclassids
+        self.summed_area = False
+        self.pyramid = False
+
+    def __getitem__(self, idx):
+        mask = self.archive.mask(idx)
+        return self.sample_type(mask=mask, classid=self.classids[idx], on=int(self.archive.ons[idx]),
+                                classname=self.classnames[idx], inclassid=self.inclassids[idx],
+                                sat=self.archive.sat(idx) if self.summed_area else None,
+                                pyramid=[mask] + self.archive.pyramid(idx, 1) if self.pyramid else None)
+
+    def __len__(self):
+        return len(self.archive)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
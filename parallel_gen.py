@@ -0,0 +1,78 @@
+import multiprocessing as mp
+from pathlib import Path
+
+import numpy as np
+
+_generator = None                 # Set in the parent before forking, so all the workers share one canvas
+
+
+def _run_task(task):
+    start, count, seedseq = task
+    rng = np.random.default_rng(seedseq)
+    batch, names = _generator.get_batch(count, rng=rng)
+    return start, batch, names
+
+
+def generate(generator, num_samples, seed, filename, num_workers=None, chunk_size=64):
+    """
+    Generate num_samples samples with a pool of processes and save them to filename (.npy),
+    along with their names (one per line) in a .txt file next to it.
+
+    The samples are split into fixed chunks of chunk_size, and each chunk draws from its own
+    np.random.Generator spawned from SeedSequence(seed). Chunks are written in order, so the output
+    depends only on (seed, num_samples, chunk_size), and is byte-identical for any num_workers.
+    """
+    global _generator
+    num_workers = num_workers or mp.cpu_count()
+    starts = range(0, num_samples, chunk_size)
+    seedseqs = np.random.SeedSequence(seed).spawn(len(starts))
+    tasks = [(start, min(chunk_size, num_samples - start), ss) for start, ss in zip(starts, seedseqs)]
+
+    out = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float32,
+                                    shape=(num_samples, generator.sample_size, 5))
+    names = [None] * num_samples
+
+    def write(results):
+        for start, batch, batch_names in results:
+            out[start:start + len(batch)] = batch
+            names[start:start + len(batch)] = batch_names
+
+    generator.pack_masks()
+    _generator = generator
+    try:
+        if num_workers == 1:
+            write(map(_run_task, tasks))
+        else:
+            with mp.get_context("fork").Pool(num_workers) as pool:
+                write(pool.imap(_run_task, tasks))
+    finally:
+        _generator = None
+
+    out.flush()
+    Path(filename).with_suffix(".txt").write_text("\n".join(names) + "\n")
+    return filename
+
+
+if __name__ == "__main__":
+    import sys
+    from ImageSet import ImageSet
+    from Generator import Generator5, Generator6
+
+    try:
+        num_samples = int(sys.argv[1])
+        seed = int(sys.argv[2])
+        num_workers = int(sys.argv[3])
+    except:
+        print(f"Usage: python {sys.argv[0]} <num_samples> <seed> <num_workers>")
+        print("Using default values")
+        num_samples = 1400
+        seed = 0
+        num_workers = mp.cpu_count()
+
+    imageset = ImageSet("data/MPEG7")
+
+    generator6 = Generator6(imageset, sample_size=500, target_halfside=5., unit_side=.05, cache_dir="data/cache")
+    generate(generator6, num_samples, seed, f"data/hex_{seed}.npy", num_workers)
+
+    generator5 = Generator5(imageset, sample_size=500, target_halfside=5., unit_side=.1, cache_dir="data/cache")
+    generate(generator5, num_samples, seed, f"data/pen_{seed}.npy", num_workers)
@@ -0,0 +1,127 @@
+import numpy as np
+
+from pen_base import Fatt, Thin, TriangleGrid, PenGrid, psi, psi2, first_of_each_center
+
+
+class TriangleArray:
+    """
+    P3 Penrose tiling stored as a struct of arrays.
+        A, B, C: complex arrays of the triangle vertices (same convention as Triangle)
+        fatt: boolean array, True for Fatt and False for Thin triangles
+    """
+    def __init__(self, A, B, C, fatt):
+        self.A = np.asarray(A, dtype=complex)
+        self.B = np.asarray(B, dtype=complex)
+        self.C = np.asarray(C, dtype=complex)
+        self.fatt = np.asarray(fatt, dtype=bool)
+
+    @classmethod
+    def from_grid(cls, grid):
+        """ Build from a TriangleGrid (or any iterable of Fatt/Thin triangles). """
+        elements = list(grid)
+        return cls([t.A for t in elements],
+                   [t.B for t in elements],
+                   [t.C for t in elements],
+                   [isinstance(t, Fatt) for t in elements])
+
+    def to_grid(self):
+        """ Convert back to a TriangleGrid of Fatt/Thin objects. """
+        return TriangleGrid([(Fatt if f else Thin)(a, b, c)
+                             for a, b, c, f in zip(self.A.tolist(), self.B.tolist(), self.C.tolist(),
+                                                   self.fatt.tolist())])
+
+    def to_pengrid(self):
+        return PenGrid.from_triangle_arrays(self.A, self.B, self.C, self.fatt)
+
+    def remove_mirror_images(self):
+        """
+        Keep only one of each pair of tiles that are mirror images of each other.
+        """
+        self.select(first_of_each_center(self.centers))
+
+    def select(self, keep):
+        """ Keep only the triangles given by an index or boolean array (preserving their order). """
+        self.A, self.B, self.C, self.fatt = self.A[keep], self.B[keep], self.C[keep], self.fatt[keep]
+
+    def inflate(self, times=1):
+        """
+        "Inflate" all the triangles of a level at once.
+        Children are laid out in the same order as TriangleGrid.inflate produces them.
+        """
+        for _ in range(times):
+            A, B, C, fatt = self.A, self.B, self.C, self.fatt
+            nchildren = np.where(fatt, 3, 2)
+            start = np.cumsum(nchildren) - nchildren
+            total = int(nchildren.sum())
+
+            newA = np.empty(total, dtype=complex)
+            newB = np.empty(total, dtype=complex)
+            newC = np.empty(total, dtype=complex)
+            newfatt = np.empty(total, dtype=bool)
+
+            # Fatt -> Fatt(D, E, A), Thin(E, D, B), Fatt(C, D, B)
+            i = start[fatt]
+            a, b, c = A[fatt], B[fatt], C[fatt]
+            D = psi2 * a + psi * c
+            E = psi2 * a + psi * b
+            newA[i], newB[i], newC[i], newfatt[i] = D, E, a, True
+            newA[i+1], newB[i+1], newC[i+1], newfatt[i+1] = E, D, b, False
+            newA[i+2], newB[i+2], newC[i+2], newfatt[i+2] = c, D, b, True
+
+            # Thin -> Thin(D, C, A), Fatt(C, D, B)
+            thin = ~fatt
+            i = start[thin]
+            a, b, c = A[thin], B[thin], C[thin]
+            D = psi * a + psi2 * b
+            newA[i], newB[i], newC[i], newfatt[i] = D, c, a, False
+            newA[i+1], newB[i+1], newC[i+1], newfatt[i+1] = c, D, b, True
+
+            self.A, self.B, self.C, self.fatt = newA, newB, newC, newfatt
+
+    @property
+    def centers(self):
+        """ Centers of the bases, as a complex array. """
+        return (self.A + self.C) / 2
+
+    @property
+    def centers_xy(self):
+        """ Centers of the bases, as an (N, 2) float array. """
+        c = self.centers
+        return np.stack([c.real, c.imag], axis=1)
+
+    @property
+    def side(self):
+        return abs(self.B[0] - self.A[0])
+
+    def __len__(self):
+        return len(self.fatt)
+
+
+if __name__ == '__main__':
+    import sys
+    import copy
+    import time
+    from pen_shapes import circle_tiling
+
+    try:
+        max_level = int(sys.argv[1])
+    except:
+        print(f"Usage: python {sys.argv[0]} <max_level>")
+        print("Using default values")
+        max_level = 12
+
+    print(f"{'level':>5s} {'tiles':>9s} {'objects(s)':>11s} {'arrays(s)':>10s} {'speedup':>8s}")
+    for level in range(5, max_level + 1):
+        trianglegrid = copy.deepcopy(circle_tiling)
+        t0 = time.perf_counter()
+        trianglegrid.inflate(level)
+        t_obj = time.perf_counter() - t0
+
+        trianglearray = TriangleArray.from_grid(circle_tiling)
+        t0 = time.perf_counter()
+        trianglearray.inflate(level)
+        t_arr = time.perf_counter() - t0
+
+        assert len(trianglegrid) == len(trianglearray)
+        print(f"{level:5d} {len(trianglearray):9d} {t_obj:11.4f} {t_arr:10.4f} {t_obj/t_arr:7.1f}x")
+        del trianglegrid
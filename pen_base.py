@@ -1,7 +1,8 @@
 import math
 import cmath
-import copy
-from utils import cross
+import numpy as np
+from collections import namedtuple
+from utils import cross, ArrayGrid
 
 TOL = 1.e-5                       # A small tolerance for comparing floats for equality
 psi = (math.sqrt(5) - 1) / 2      # psi = 1/phi where phi is the Golden ratio, (sqrt(5)+1)/2 = 0.618033988749895
@@ -116,6 +117,33 @@ class Thin(Triangle):
                 Fatt(self.C, D, self.B)]
 
 
+def first_of_each_center(centers):
+    """
+    Indices, in increasing order, of the first tile at each center (mirror images share the center of the base).
+    centers: complex array, compared after rounding to TOL.
+    """
+    keys = np.stack([np.round(centers.real / TOL), np.round(centers.imag / TOL)], axis=1).astype(np.int64)
+    _, first = np.unique(keys, axis=0, return_index=True)
+    first.sort()
+    return first
+
+
+def reparametrize_arrays(A, B, C):
+    """
+    Triangle.reparametrize for complex arrays of vertices. Returns (center, angle, side) arrays.
+    """
+    M = (A + C) / 2
+    MB = B - M
+    # cmath.phase is libm atan2, numpy's own (SIMD) version can differ in the last bit
+    angle = np.array([math.atan2(y, x) for y, x in zip(MB.imag.tolist(), MB.real.tolist())])
+    AB = B - A
+    side = np.hypot(AB.real, AB.imag)
+    AC = C - A
+    angle = np.where(MB.real * AC.imag - MB.imag * AC.real < 0, angle + math.pi, angle)
+    angle = (angle + math.pi) % (2 * math.pi) - math.pi
+    return M, angle, side
+
+
 class TriangleGrid:
     """ P3 Penrose tiling made of two types of triangles. """
     def __init__(self, initial_tiles):
@@ -154,15 +182,8 @@ class TriangleGrid:
         """
         Keep only one of each pair of tiles that are mirror images of each other.
         """
-        seen_centers = set()
-        new_elements = []
-        for t in self.elements:
-            c = t.center
-            c_key = (round(c.real / TOL) , round(c.imag / TOL))  # Use rounded coordinates as key
-            if c_key not in seen_centers:
-                seen_centers.add(c_key)
-                new_elements.append(t)
-        self.elements = new_elements
+        keep = first_of_each_center(np.array([t.center for t in self.elements], dtype=complex))
+        self.elements = [self.elements[i] for i in keep]
 
     @property
     def side(self):
@@ -177,6 +198,8 @@ class Rhombus:
     angle: angle of MB relative to horizontal (in radians)
     side: length of side AB
     """
+    __slots__ = ('center', 'tilt', 'side', 'type', 'color')
+
     def __init__(self, tri):
         if isinstance(tri, Triangle):
             m, t, s = tri.reparametrize()
@@ -243,19 +266,33 @@ class Rhombus:
     def y(self):
         return self.center.imag
 
-from collections import namedtuple
+Rhom = namedtuple('Rhom', ['center', 'color', 'tilt', 'side'])
 
 class PenGrid:
     def __init__(self, triangles, from_rhombuses=False, from_np=False):
         if from_rhombuses:
             self.rhombuses = triangles
         elif from_np:
-            Rhom = namedtuple('Rhom', ['center', 'color', 'tilt', 'side'])
             self.rhombuses = [Rhombus(Rhom(complex(t[0], t[1]), t[2], t[3], t[4])) for t in triangles]
         else:
-            triangles = copy.deepcopy(triangles)
-            triangles.remove_mirror_images()
-            self.rhombuses = [Rhombus(t) for t in triangles]
+            elements = list(triangles)
+            A = np.array([t.A for t in elements], dtype=complex)
+            B = np.array([t.B for t in elements], dtype=complex)
+            C = np.array([t.C for t in elements], dtype=complex)
+            fatt = np.array([isinstance(t, Fatt) for t in elements], dtype=bool)
+            self.rhombuses = PenGrid.from_triangle_arrays(A, B, C, fatt).rhombuses
+
+    @classmethod
+    def from_triangle_arrays(cls, A, B, C, fatt):
+        """
+        Build from complex arrays of triangle vertices and their Fatt flags,
+        dropping mirror images and reparametrizing in bulk.
+        """
+        keep = first_of_each_center((A + C) / 2)
+        center, tilt, side = reparametrize_arrays(A[keep], B[keep], C[keep])
+        return cls([Rhombus(Rhom(m, f, t, s)) for m, f, t, s in
+                    zip(center.tolist(), fatt[keep].tolist(), tilt.tolist(), side.tolist())],
+                   from_rhombuses=True)
 
     def rotate(self, alpha):
         for h in self.rhombuses:
@@ -278,3 +315,26 @@ class PenGrid:
     @property
     def side(self):
         return abs(self.rhombuses[0].side)
+
+
+class PenArrayGrid(ArrayGrid):
+    """
+    PenGrid over an (N, 5) Generator5 sample matrix (x, y, color, tilt, side), color 1 being Fatt.
+    """
+    def tile(self, i):
+        x, y, color, tilt, side = self.matrix[i].tolist()
+        return Rhombus(Rhom(complex(x, y), color, tilt, side))
+
+    @property
+    def centers(self):
+        centers = np.empty(len(self), dtype=complex)
+        centers.real, centers.imag = self.x, self.y
+        return centers
+
+    @property
+    def fatt(self):
+        return self.colors != 0
+
+    @property
+    def side(self):
+        return abs(self.matrix[0, 4])
@@ -0,0 +1,209 @@
+import numpy as np
+
+from pen_array import TriangleArray
+
+# Vertices are unit × (c0 + c1 ω + c2 ω² + c3 ω³), ω = exp(iπ/5) a primitive 10th root of unity,
+# with integer coefficients: Z[ω] holds psi = ω² - ω³ and psi2 = 1 - psi, so inflation stays in it.
+OMEGA = np.exp(1j * np.pi / 5)
+BASIS = OMEGA ** np.arange(4)
+
+# Multiplication by ω on the coefficients, as ω⁴ = -1 + ω - ω² + ω³
+_M_OMEGA = np.array([[0, 0, 0, -1],
+                     [1, 0, 0, 1],
+                     [0, 1, 0, -1],
+                     [0, 0, 1, 1]], dtype=np.int64)
+_M_PSI = np.linalg.matrix_power(_M_OMEGA, 2) - np.linalg.matrix_power(_M_OMEGA, 3)
+_M_PSI2 = np.eye(4, dtype=np.int64) - _M_PSI
+
+# Coefficients to (z, σ(z)), σ being the other embedding ω -> ω³, and back
+_MINKOWSKI = np.array([BASIS.real, BASIS.imag, (OMEGA ** (3 * np.arange(4))).real,
+                       (OMEGA ** (3 * np.arange(4))).imag])
+_MINKOWSKI_INV = np.linalg.inv(_MINKOWSKI)
+
+MAX_COEFFICIENT = 1 << 58            # Inflation raises OverflowError beyond, well before int64 wraps around
+
+
+def to_complex(coefs, unit=1.):
+    """ The complex numbers of (..., 4) integer coefficients. """
+    return (coefs @ BASIS) * unit
+
+
+def to_exact(z, unit=1., max_conjugate=8., tol=1e-9):
+    """
+    The (..., 4) integer coefficients of the complex numbers z, which must be unit × an element of Z[ω]
+    whose conjugate σ(z/unit) is at most max_conjugate in size (as for the vertices of the pen_shapes in units
+    of their side). The coefficients are a linear function of the unknown conjugate, which is searched for
+    by trying the integer values of two of them, so this is meant for small starting tilings.
+    Raises ValueError when no such coefficients reproduce z to tol × unit.
+    """
+    z = np.asarray(z, dtype=complex) / unit
+    shape = z.shape
+    z = z.ravel()
+    c0 = np.stack([z.real, z.imag], axis=1) @ _MINKOWSKI_INV[:, :2].T           # Coefficients for σ = 0
+    N = _MINKOWSKI_INV[:, 2:]                                                     # Their change with σ
+    j = [0, 1]
+    m = int(np.ceil(np.hypot(*N[j].T).max() * max_conjugate)) + 1
+    grid = np.stack(np.meshgrid(np.arange(-m, m + 1), np.arange(-m, m + 1)), axis=-1).reshape(-1, 2)
+
+    k = np.rint(c0[:, None, j]) + grid                                            # (P, G, 2) trial values
+    conjugate = (k - c0[:, None, j]) @ np.linalg.inv(N[j]).T
+    coefs = c0[:, None] + conjugate @ N.T                                         # (P, G, 4)
+    size = np.hypot(*conjugate.transpose(2, 0, 1))
+    valid = (abs(coefs - np.rint(coefs)).max(axis=2) < 1e-6) & (size <= max_conjugate)
+    best = np.argmin(np.where(valid, size, np.inf), axis=1)
+    coefs = np.rint(coefs[np.arange(len(z)), best]).astype(np.int64)
+
+    error = np.where(valid.any(axis=1), abs(coefs @ BASIS - z), np.inf)
+    if error.size and error.max() > tol:
+        raise ValueError(f"Not exactly representable in units of {unit}: worst error {error.max():.3g}")
+    return coefs.reshape(shape + (4,))
+
+
+class ExactTriangleArray:
+    """
+    P3 Penrose tiling as TriangleArray, but with exact vertices:
+        A, B, C: (N, 4) int64 coefficients of the vertices in units of unit (see to_complex)
+        fatt: boolean array, True for Fatt and False for Thin triangles
+    Inflation and mirror removal are integer operations, floats are only made by to_array.
+    """
+    def __init__(self, A, B, C, fatt, unit=1.):
+        self.A = np.asarray(A, dtype=np.int64).reshape(-1, 4)
+        self.B = np.asarray(B, dtype=np.int64).reshape(-1, 4)
+        self.C = np.asarray(C, dtype=np.int64).reshape(-1, 4)
+        self.fatt = np.asarray(fatt, dtype=bool)
+        self.unit = unit
+
+    @classmethod
+    def from_array(cls, triangles, unit=None):
+        """
+        Exact copy of a TriangleArray, unit defaulting to the side of its first triangle.
+        Raises ValueError if its vertices are not (to within rounding) in unit × Z[ω].
+        """
+        if unit is None:
+            unit = abs(triangles.B[0] - triangles.A[0])
+        return cls(to_exact(triangles.A, unit), to_exact(triangles.B, unit), to_exact(triangles.C, unit),
+                   triangles.fatt, unit)
+
+    @classmethod
+    def from_grid(cls, grid, unit=None):
+        """ Build from a TriangleGrid (or any iterable of Fatt/Thin triangles), see from_array. """
+        return cls.from_array(TriangleArray.from_grid(grid), unit)
+
+    def to_array(self):
+        """ TriangleArray with the (complex) vertices, all converted at once. """
+        return TriangleArray(to_complex(self.A, self.unit), to_complex(self.B, self.unit),
+                             to_complex(self.C, self.unit), self.fatt.copy())
+
+    def to_grid(self):
+        return self.to_array().to_grid()
+
+    def to_pengrid(self):
+        """ PenGrid of the rhombuses, the mirror images being dropped exactly. """
+        tiles = ExactTriangleArray(self.A, self.B, self.C, self.fatt, self.unit)
+        tiles.remove_mirror_images()
+        return tiles.to_array().to_pengrid()
+
+    def remove_mirror_images(self):
+        """
+        Keep only the first of each pair of tiles that are mirror images of each other,
+        i.e. share the center of their base (exactly, as the integer key A + C).
+        """
+        _, first = np.unique(self.A + self.C, axis=0, return_index=True)
+        first.sort()
+        self.select(first)
+
+    def select(self, keep):
+        """ Keep only the triangles given by an index or boolean array (preserving their order). """
+        self.A, self.B, self.C, self.fatt = self.A[keep], self.B[keep], self.C[keep], self.fatt[keep]
+
+    def inflate(self, times=1):
+        """
+        "Inflate" all the triangles of a level at once, in the same order as TriangleArray.inflate.
+        The coefficients grow by about phi per level, so int64 lasts for about 80 levels (OverflowError beyond).
+        """
+        for _ in range(times):
+            A, B, C, fatt = self.A, self.B, self.C, self.fatt
+            if max(abs(A).max(initial=0), abs(B).max(initial=0), abs(C).max(initial=0)) > MAX_COEFFICIENT:
+                raise OverflowError("Vertex coefficients too large for int64, inflate less deep")
+            nchildren = np.where(fatt, 3, 2)
+            start = np.cumsum(nchildren) - nchildren
+            total = int(nchildren.sum())
+
+            newA = np.empty((total, 4), dtype=np.int64)
+            newB = np.empty((total, 4), dtype=np.int64)
+            newC = np.empty((total, 4), dtype=np.int64)
+            newfatt = np.empty(total, dtype=bool)
+
+            # Fatt -> Fatt(D, E, A), Thin(E, D, B), Fatt(C, D, B)
+            i = start[fatt]
+            a, b, c = A[fatt], B[fatt], C[fatt]
+            D = a @ _M_PSI2.T + c @ _M_PSI.T
+            E = a @ _M_PSI2.T + b @ _M_PSI.T
+            newA[i], newB[i], newC[i], newfatt[i] = D, E, a, True
+            newA[i+1], newB[i+1], newC[i+1], newfatt[i+1] = E, D, b, False
+            newA[i+2], newB[i+2], newC[i+2], newfatt[i+2] = c, D, b, True
+
+            # Thin -> Thin(D, C, A), Fatt(C, D, B)
+            thin = ~fatt
+            i = start[thin]
+            a, b, c = A[thin], B[thin], C[thin]
+            D = a @ _M_PSI.T + b @ _M_PSI2.T
+            newA[i], newB[i], newC[i], newfatt[i] = D, c, a, False
+            newA[i+1], newB[i+1], newC[i+1], newfatt[i+1] = c, D, b, True
+
+            self.A, self.B, self.C, self.fatt = newA, newB, newC, newfatt
+
+    def vertex_ids(self):
+        """
+        The distinct vertices, as an (M, 4) coefficient array, and the (N, 3) indices into it of A, B, C,
+        so that triangles sharing a vertex share its id exactly (for adjacency or hashing).
+        """
+        vertices, ids = np.unique(np.concatenate([self.A, self.B, self.C]), axis=0, return_inverse=True)
+        return vertices, ids.reshape(3, -1).T
+
+    @property
+    def centers(self):
+        """ Centers of the bases, as a complex array. """
+        return to_complex(self.A + self.C, self.unit / 2)
+
+    @property
+    def side(self):
+        return abs(to_complex(self.B[0] - self.A[0], self.unit))
+
+    def __len__(self):
+        return len(self.fatt)
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from pen_base import first_of_each_center
+    from pen_shapes import circle_tiling
+
+    try:
+        max_level = int(sys.argv[1])
+    except:
+        print(f"Usage: python {sys.argv[0]} <max_level>")
+        print("Using default values")
+        max_level = 12
+
+    print(f"{'level':>5s} {'tiles':>9s} {'float(s)':>9s} {'exact(s)':>9s} {'drift/side':>11s} {'rhombuses':>17s}")
+    for level in range(5, max_level + 1):
+        trianglearray = TriangleArray.from_grid(circle_tiling)
+        t0 = time.perf_counter()
+        trianglearray.inflate(level)
+        t_float = time.perf_counter() - t0
+
+        exact = ExactTriangleArray.from_grid(circle_tiling)
+        t0 = time.perf_counter()
+        exact.inflate(level)
+        t_exact = time.perf_counter() - t0
+
+        # How far the floating point vertices have drifted, and how many tiles each dedup keeps
+        converted = exact.to_array()
+        drift = max(abs(converted.A - trianglearray.A).max(), abs(converted.B - trianglearray.B).max(),
+                    abs(converted.C - trianglearray.C).max()) / exact.side
+        kept_float = len(first_of_each_center(trianglearray.centers))
+        exact.remove_mirror_images()
+        print(f"{level:5d} {len(trianglearray):9d} {t_float:9.4f} {t_exact:9.4f} {drift:11.2e} "
+              f"{kept_float:8d}/{len(exact):8d}")
@@ -2,22 +2,22 @@ import copy
 
 from utils import print_tile_stats, inscribed_square_halfside
 from pen_shapes import circle_tiling
-from pen_base import PenGrid
+from pen_array import TriangleArray
 
 TOL = 1e-6
 
 def get_pen_mother_tiles(target_halfside, target_pen_side):
-    trianglegrid = copy.deepcopy(circle_tiling)
+    trianglearray = TriangleArray.from_grid(circle_tiling)
     target_elements = target_halfside / target_pen_side
 
     while True:
-        tiss = inscribed_square_halfside(trianglegrid)/target_elements
-        print(f"Target Inscribed side: {tiss:6.1f} Scaled side: {trianglegrid.side:7.1f}")
-        if trianglegrid.side < tiss:
+        tiss = inscribed_square_halfside(trianglearray.centers_xy)/target_elements
+        print(f"Target Inscribed side: {tiss:6.1f} Scaled side: {trianglearray.side:7.1f}")
+        if trianglearray.side < tiss:
             break
-        trianglegrid.inflate(1)
+        trianglearray.inflate(1)
 
-    pengrid = PenGrid(trianglegrid)
+    pengrid = trianglearray.to_pengrid()
 
     original_side = pengrid.side
     pengrid.scale(target_pen_side/original_side)
@@ -1,7 +1,7 @@
 import math
-import copy
-from utils import cross, svg_path, vertexy
-from pen_base import PenGrid, TriangleGrid
+import numpy as np
+from utils import cross, svg_numbers, svg_join, svg_polygons_compact
+from pen_base import PenGrid, PenArrayGrid, TriangleGrid, Fatt
 
 def svg_arc(U, V, W):
     """
@@ -29,7 +29,91 @@ def svg_arcs(rhombus):
     return arc_a, arc_c
 
 
-def save_svg(pengrid: PenGrid|TriangleGrid, filename, additional_config={}, target_side=20):
+def rhombus_arrays(pengrid: PenGrid):
+    """
+    The rhombuses of pengrid as arrays: complex centers, tilts, sides and whether they are Fatt.
+    """
+    if isinstance(pengrid, PenArrayGrid):
+        return pengrid.centers, pengrid.angles.astype(float), pengrid.sides.astype(float), pengrid.fatt
+    rhombuses = list(pengrid)
+    center = np.array([r.center for r in rhombuses], dtype=complex)
+    tilt = np.array([r.tilt for r in rhombuses], dtype=float)
+    side = np.array([r.side for r in rhombuses], dtype=float)
+    fatt = np.array([r.type == Fatt for r in rhombuses], dtype=bool)
+    return center, tilt, side, fatt
+
+
+def rhombus_vertices(center, tilt, side, fatt):
+    """
+    Vertices A, B, C, D of all the rhombuses at once (same arithmetic as Rhombus.triangle).
+    """
+    # cmath.exp(1j * tilt) is computed by libm cos and sin, numpy's own (SIMD) versions can differ in the last bit
+    uMB = np.empty(len(tilt), dtype=complex)                  # Direction from M to B
+    uMB.real = [math.cos(t) for t in tilt.tolist()]
+    uMB.imag = [math.sin(t) for t in tilt.tolist()]
+    uAC = -1j * uMB                                           # Perpendicular direction (base direction)
+
+    half_base = side * np.where(fatt, math.sin(3 * math.pi / 5 / 2), math.sin(math.pi / 5 / 2))
+    height = side * np.where(fatt, math.cos(3 * math.pi / 5 / 2), math.cos(math.pi / 5 / 2))
+
+    B = center - height * uMB
+    A = center + half_base * uAC
+    C = center - half_base * uAC
+    D = A - B + C
+    return A, B, C, D
+
+
+def arc_ends(U, V, W):
+    """
+    Start, end and radius of the arcs of svg_arc(U, V, W) for arrays of vertices.
+    """
+    start = (U + V) / 2
+    half = (V - U) / 2
+    r = np.hypot(half.real, half.imag)    # arc radius, abs() of a Python complex is libm hypot
+    end = (U + W) / 2
+
+    # Ensure we draw the arc for the angular component < 180 deg
+    US, UE = start - U, end - U
+    swap = US.real * UE.imag - US.imag * UE.real < 0
+    start, end = np.where(swap, end, start), np.where(swap, start, end)
+    return start, end, r
+
+
+def svg_arcs_bulk(U, V, W):
+    """
+    SVG "d" paths of svg_arc(U, V, W) for arrays of vertices.
+    """
+    start, end, r = arc_ends(U, V, W)
+    return ['M {} {} A {} {} 0 0 0 {} {}'.format(*args)
+            for args in zip(start.imag.tolist(), start.real.tolist(), r.tolist(), r.tolist(),
+                            end.imag.tolist(), end.real.tolist())]
+
+
+def svg_arcs_compact(U, V, W, precision=1):
+    """
+    All the arcs of svg_arcs_bulk(U, V, W) as subpaths of one SVG "d" path, in relative commands
+    (m from the end of the previous arc) with the given number of decimals.
+    """
+    start, end, r = arc_ends(U, V, W)
+    if len(r) == 0:
+        return ""
+    q = 10 ** precision
+    sx, sy = np.round(start.imag * q).astype(np.int64), np.round(start.real * q).astype(np.int64)
+    ex, ey = np.round(end.imag * q).astype(np.int64), np.round(end.real * q).astype(np.int64)
+    rq = np.round(r * q).astype(np.int64)
+    numbers = np.stack([sx - np.concatenate([[0], ex[:-1]]), sy - np.concatenate([[0], ey[:-1]]),
+                        rq, ex - sx, ey - sy], axis=1)
+    mx, my, rr, dx, dy = np.array(svg_numbers(numbers.ravel().tolist(), precision)).reshape(-1, 5).T.tolist()
+    return "".join(f"m{svg_join([a, b])}a{svg_join([c, c, '0 0 0', d, e])}"
+                   for a, b, c, d, e in zip(mx, my, rr, dx, dy))
+
+
+def save_svg(pengrid: PenGrid|PenArrayGrid|TriangleGrid, filename, additional_config={}, target_side=20, compact=False):
+    """
+    compact: draw all the tiles of a colour as one path (and all the arcs about A, or C, as one path),
+        in relative coordinates, with the colours as CSS classes. The tiles are the same, the arcs are rounded
+        to config['arc-precision'] decimals and drawn after all the tiles.
+    """
     # Default configuration
     config = {
             'stroke-colour': '#ffffff',
@@ -41,36 +125,32 @@ def save_svg(pengrid: PenGrid|TriangleGrid, filename, additional_config={}, targ
             'Carc-colour': '#f0c030',
             'draw-arcs': True,
             'tile-opacity': 0.5,
+            'arc-precision': 1,
             }
     config.update(additional_config)
 
     if isinstance(pengrid, TriangleGrid):
         pengrid = PenGrid(pengrid)
 
-    def tile_colour(e):
-        if e.__class__.__name__ == 'Fatt' or (hasattr(e, 'topangle') and abs(e.topangle - (3*math.pi/5)) < 1e-6):
-            return config['Ltile-colour']
-        else:
-            return config['Stile-colour']
+    center, tilt, side, fatt = rhombus_arrays(pengrid)
 
     # Scale to target side
     orig_side = pengrid.side
     if not (.5 < orig_side/target_side < 1.5):
         scale_factor = target_side / orig_side
-        pengrid = copy.deepcopy(pengrid)
-        for t in pengrid:
-            t.scale(scale_factor)
+        center = center * scale_factor
+        side = side * scale_factor
+
+    A, B, C, D = rhombus_vertices(center, tilt, side, fatt)
+
+    # Rounded vertices, flipping x, y to match image convention
+    vertices = np.stack([A, B, C, D], axis=1)
+    xs = np.round(vertices.imag).astype(int)
+    ys = np.round(vertices.real).astype(int)
 
     # Determine viewbox size
-    xmin = ymin = float('inf')
-    xmax = ymax = float('-inf')
-    for t in pengrid:
-        for v in t.vertices:
-            y, x = vertexy(v)
-            xmin = min(xmin, x)
-            xmax = max(xmax, x)
-            ymin = min(ymin, y)
-            ymax = max(ymax, y)
+    xmin, xmax = int(xs.min()), int(xs.max())
+    ymin, ymax = int(ys.min()), int(ys.max())
 
     wd, ht = xmax-xmin, ymax-ymin
     m = config['margin']
@@ -87,20 +167,38 @@ def save_svg(pengrid: PenGrid|TriangleGrid, filename, additional_config={}, targ
         f'<g style="stroke:{config["stroke-colour"]}; stroke-width: {config["base-stroke-width"]}; stroke-linejoin: round; opacity: {config["tile-opacity"]};">'
     ]
 
-    for t in pengrid:
-        dpath = svg_path(t)
-        svg.append(f'<path fill="{tile_colour(t)}" d="{dpath}"/>')
+    if compact:
+        svg.insert(2, f'<style>.S{{fill:{config["Stile-colour"]}}} .L{{fill:{config["Ltile-colour"]}}} '
+                      f'.A{{fill:none;stroke:{config["Aarc-colour"]}}} '
+                      f'.C{{fill:none;stroke:{config["Carc-colour"]}}}</style>')
+        paths = [('S', svg_polygons_compact(xs[~fatt], ys[~fatt])), ('L', svg_polygons_compact(xs[fatt], ys[fatt]))]
+        if config['draw-arcs']:
+            paths += [('A', svg_arcs_compact(A, B, D, config['arc-precision'])),
+                      ('C', svg_arcs_compact(C, B, D, config['arc-precision']))]
+        svg.extend(f'<path class="{c}" d="{d}"/>' for c, d in paths if d)
+
+    else:
+        xy = np.stack([xs, ys], axis=2).reshape(len(xs), -1).tolist()
+        colours = np.where(fatt, config['Ltile-colour'], config['Stile-colour']).tolist()
+        paths = [f'<path fill="{c}" d="M{p[0]},{p[1]} L{p[2]},{p[3]} L{p[4]},{p[5]} L{p[6]},{p[7]} Z"/>'
+                 for c, p in zip(colours, xy)]
 
         if config['draw-arcs']:
-            arc1_d, arc2_d = svg_arcs(t)
-            svg.append(f'<path fill="none" stroke="{config["Aarc-colour"]}" d="{arc1_d}"/>')
-            svg.append(f'<path fill="none" stroke="{config["Carc-colour"]}" d="{arc2_d}"/>')
+            arcs_a = svg_arcs_bulk(A, B, D)
+            arcs_c = svg_arcs_bulk(C, B, D)
+            for dpath, arc1_d, arc2_d in zip(paths, arcs_a, arcs_c):
+                svg.append(dpath)
+                svg.append(f'<path fill="none" stroke="{config["Aarc-colour"]}" d="{arc1_d}"/>')
+                svg.append(f'<path fill="none" stroke="{config["Carc-colour"]}" d="{arc2_d}"/>')
+        else:
+            svg.extend(paths)
 
     svg.append('</g>\n</svg>')
     svg = '\n'.join(svg)
 
-    with open(filename, 'w') as fo:
-        fo.write(svg)
+    if filename is not None:                # None: only return the svg (e.g. for a sinks.BackgroundWriter)
+        with open(filename, 'w') as fo:
+            fo.write(svg)
 
     # print(f'Wrote SVG to {filename}')
-    return svg
\ No newline at end of file
+    return svg
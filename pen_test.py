@@ -99,3 +99,22 @@ def consistency_checks(self:Rhombus, tri:Triangle):
     dot_product = (uAC.real * orig_uAC.real + uAC.imag * orig_uAC.imag)
     if abs(dot_product) - 1 > TOL:
         raise ValueError(f"Inconsistent base direction in Rhombus initialization. dot_product = {dot_product}")
+
+
+#---------------------------------------------------------------------------------
+# Pentagrid Test (The patches of de Bruijn's construction obey the matching rules, as the inflated tilings do)
+# --------------------------------------------------------------------------------
+def test_pentagrid_arcs(halfside=2., side=.1, num_seeds=4):
+    import numpy as np
+    from pentagrid import pentagrid_tiles, random_offsets
+    from validate import validate_rhombuses
+
+    for seed in range(num_seeds):
+        tiles = pentagrid_tiles(random_offsets(np.random.default_rng(seed)), -halfside, -halfside, halfside, halfside,
+                                side=side, rotation=seed / 10)
+        report = validate_rhombuses(tiles)
+        print(f"seed={seed} {report['arcs']}")
+        assert report["overlap"]["passed"] and report["arcs"]["passed"]
+        for color in (0, 1):
+            tilts = np.unique(np.round(np.rad2deg(tiles[tiles[:, 2] == color, 3]) % 360, 6))
+            assert len(tilts) == 10
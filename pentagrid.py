@@ -0,0 +1,88 @@
+import math
+import numpy as np
+
+# Tiles are within this distance of 5/2 p + Σ γ_i e_i for the pentagrid point p they come from
+# (each of the five ceil's is off by less than 1, plus half of the two rhombus edges)
+MARGIN = 6.
+
+
+def random_offsets(rng=None):
+    """ Five pentagrid offsets summing to 0 (which makes the dual a Penrose P3 tiling). """
+    rng = np.random if rng is None else rng
+    offsets = np.empty(5)
+    offsets[:4] = rng.uniform(0, 1, 4)
+    offsets[4] = -offsets[:4].sum()
+    return offsets
+
+
+def pentagrid_tiles(offsets, xmin, ymin, xmax, ymax, side=1., rotation=0.):
+    """
+    de Bruijn's construction: The rhombuses of the Penrose tiling dual to the pentagrid
+        {p : p·e_i + offsets[i] ∈ Z},  e_i = exp(1j * (2πi/5 + rotation)),  i = 0..4
+    whose centers lie in the window [xmin, xmax] × [ymin, ymax].
+    Each crossing of grid lines j < l gives the rhombus with edges e_j, e_l (Fatt when they are 72° apart)
+    at the vertex Σ K_i e_i, K_i = ceil(p·e_i + offsets[i]).
+    The work is proportional to the number of tiles in the window.
+
+    Returns an (N, 5) array of (x, y, color, tilt, side), the Generator5 column layout, with color 1 for Fatt.
+    """
+    offsets = np.asarray(offsets, dtype=float)
+    e = np.exp(1j * (2 * np.pi * np.arange(5) / 5 + rotation))
+    shift = (offsets * e).sum()
+
+    # Window in unit side tiling coordinates, then in pentagrid coordinates
+    lo = (complex(xmin, ymin) / side - shift) * 2 / 5 - MARGIN * 2 / 5 * (1 + 1j)
+    hi = (complex(xmax, ymax) / side - shift) * 2 / 5 + MARGIN * 2 / 5 * (1 + 1j)
+    corners = np.array([lo, complex(lo.real, hi.imag), complex(hi.real, lo.imag), hi])
+
+    tiles = []
+    for j in range(5):
+        for l in range(j + 1, 5):
+            ej, el = e[j], e[l]
+            pj = (corners * ej.conjugate()).real + offsets[j]
+            pl = (corners * el.conjugate()).real + offsets[l]
+            KJ, KL = np.meshgrid(np.arange(math.ceil(pj.min()), math.floor(pj.max()) + 1),
+                                 np.arange(math.ceil(pl.min()), math.floor(pl.max()) + 1), indexing='ij')
+            KJ, KL = KJ.ravel(), KL.ravel()
+
+            # Crossing of line KJ of family j with line KL of family l
+            bj, bl = KJ - offsets[j], KL - offsets[l]
+            det = ej.real * el.imag - ej.imag * el.real
+            p = ((bj * el.imag - bl * ej.imag) + 1j * (bl * ej.real - bj * el.real)) / det
+            inside = (p.real >= lo.real) & (p.real <= hi.real) & (p.imag >= lo.imag) & (p.imag <= hi.imag)
+            p, KJ, KL = p[inside], KJ[inside], KL[inside]
+
+            K = np.ceil((p[:, None] * e.conjugate()).real + offsets)
+            K[:, j], K[:, l] = KJ, KL
+            center = K @ e + (ej + el) / 2
+
+            # The diagonal BD (through B, see Rhombus) is along ej - el, B being at the end that makes
+            # the arcs match (the matching rules) given by the index Σ K_i (1 or 2) of the vertex K
+            flip = (K.sum(axis=1) == 1) != (l - j > 2)
+            tilt = np.angle(ej - el) + np.pi * flip
+            fatt = (l - j) in (1, 4)
+            tiles.append(np.column_stack([center.real * side, center.imag * side,
+                                          np.full(len(p), float(fatt)), tilt, np.full(len(p), side)]))
+
+    tiles = np.concatenate(tiles)
+    x, y = tiles[:, 0], tiles[:, 1]
+    return tiles[(x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax)]
+
+
+if __name__ == '__main__':
+    import sys
+    from pen_base import PenArrayGrid
+    from pen_svg import save_svg
+
+    try:
+        halfside = float(sys.argv[1])
+        seed = int(sys.argv[2])
+    except:
+        print(f"Usage: python {sys.argv[0]} <halfside> <seed>")
+        print("Using default values")
+        halfside = 10.
+        seed = 0
+
+    tiles = pentagrid_tiles(random_offsets(np.random.default_rng(seed)), -halfside, -halfside, halfside, halfside)
+    print(f"Tiles: {len(tiles)} Fatt: {int(tiles[:, 2].sum())}")
+    save_svg(PenArrayGrid(tiles), f"pentagrid_{seed}.svg")
@@ -0,0 +1,106 @@
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import numpy as np
+
+_generator = None                 # The generator of a worker process, set by _init_worker
+
+
+def _init_worker(generator):
+    global _generator
+    _generator = generator
+
+
+def _run_batch(batch_size, seedseq):
+    return _generator.get_batch(batch_size, rng=np.random.default_rng(seedseq))
+
+
+class Prefetcher:
+    """
+    Iterate over batches of generator, computed ahead by background workers.
+        batch_size: samples per batch, each item is the (batch, names) of Generator.get_batch
+        prefetch: number of batches computed (or being computed) ahead, bounding the memory held
+        workers: number of worker threads (or processes)
+        processes: use forked worker processes (each with a copy of the generator) instead of threads
+        num_batches: stop after this many batches, None to go on forever
+    Batch k draws from the k-th child of SeedSequence(seed), so the stream depends only on the seed,
+    whatever the workers. Call close() (or use as a context manager) to stop the workers.
+    """
+    def __init__(self, generator, batch_size, prefetch=4, workers=1, processes=False, seed=None, num_batches=None):
+        if prefetch < 1 or workers < 1:
+            raise ValueError(f"prefetch and workers must be at least 1, got {prefetch} and {workers}")
+        self.generator = generator
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.workers = workers
+        self.num_batches = num_batches
+        self.seedseq = np.random.SeedSequence(seed)
+        self._submitted = 0
+        self._pending = deque()
+
+        generator.pack_masks()
+
+        if processes:
+            self._executor = ProcessPoolExecutor(workers, mp_context=mp.get_context("fork"),
+                                                 initializer=_init_worker, initargs=(generator,))
+            self._run = _run_batch
+        else:
+            self._executor = ThreadPoolExecutor(workers)
+            self._run = lambda n, seedseq: generator.get_batch(n, rng=np.random.default_rng(seedseq))
+        self._fill()
+
+    def _fill(self):
+        while len(self._pending) < self.prefetch and (self.num_batches is None or self._submitted < self.num_batches):
+            seedseq = self.seedseq.spawn(1)[0]
+            self._pending.append(self._executor.submit(self._run, self.batch_size, seedseq))
+            self._submitted += 1
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._pending:
+            raise StopIteration
+        future = self._pending.popleft()
+        self._fill()
+        return future.result()
+
+    def close(self):
+        """ Drop the batches not yet started and wait for the running ones. """
+        self._pending.clear()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from ImageSet import ImageSet
+    from Generator import Generator5
+
+    try:
+        workers = int(sys.argv[1])
+        batch_size = int(sys.argv[2])
+        num_batches = int(sys.argv[3])
+    except:
+        print(f"Usage: python {sys.argv[0]} <workers> <batch_size> <num_batches>")
+        print("Using default values")
+        workers, batch_size, num_batches = 4, 64, 20
+
+    imageset = ImageSet("data/MPEG7")
+    generator5 = Generator5(imageset, sample_size=500, target_halfside=5., unit_side=.1, cache_dir="data/cache")
+
+    for processes in (False, True):
+        t0 = time.perf_counter()
+        with Prefetcher(generator5, batch_size, prefetch=2 * workers, workers=workers, processes=processes,
+                        seed=0, num_batches=num_batches) as batches:
+            for batch, names in batches:
+                time.sleep(.01)                     # Stand-in for a training step
+        kind = "processes" if processes else "threads"
+        print(f"{kind:>9s}: {num_batches} batches in {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,131 @@
+import math
+import numpy as np
+
+
+def rhombus_polygons(matrix):
+    """
+    (N, 4, 2) vertices A, B, C, D of the rhombuses in a (N, 5) sample matrix (x, y, color, tilt, side).
+    Same construction as Rhombus.triangle, color 1 being Fatt.
+    """
+    center = matrix[:, 0] + 1j * matrix[:, 1]
+    fatt = matrix[:, 2] != 0
+    tilt, side = matrix[:, 3], matrix[:, 4]
+
+    half_base = side * np.where(fatt, math.sin(3 * math.pi / 10), math.sin(math.pi / 10))
+    height = side * np.where(fatt, math.cos(3 * math.pi / 10), math.cos(math.pi / 10))
+    uMB = np.exp(1j * tilt)
+    uAC = -1j * uMB
+
+    B = center - height * uMB
+    A = center + half_base * uAC
+    C = center - half_base * uAC
+    D = A - B + C
+    vertices = np.stack([A, B, C, D], axis=1)
+    return np.stack([vertices.real, vertices.imag], axis=2)
+
+
+def hexagon_polygons(matrix):
+    """
+    (N, 6, 2) vertices of the hexagons in a (N, 5) sample matrix (x, y, color, angle, side), as in HexXYA.vertices.
+    """
+    angles = np.pi / 3 * np.arange(6) - np.pi / 6 + matrix[:, 3:4]
+    side = matrix[:, 4:5]
+    return np.stack([matrix[:, 0:1] + side * np.cos(angles),
+                     matrix[:, 1:2] + side * np.sin(angles)], axis=2)
+
+
+polygon_makers = {"pen": rhombus_polygons, "hex": hexagon_polygons}
+
+
+def fit_extent(polys, valid, shape, margin):
+    """
+    Origin and pixel size per image, fitting the valid polygons of each image in the shape with the given margin
+    (keeping the aspect ratio). polys is (n, N, k, 2) and valid (n, N).
+    """
+    inf = np.inf
+    lo = np.where(valid[..., None, None], polys, inf).min(axis=(1, 2))        # (n, 2)
+    hi = np.where(valid[..., None, None], polys, -inf).max(axis=(1, 2))
+    empty = ~valid.any(axis=1)
+    lo[empty], hi[empty] = -1., 1.
+
+    size = (hi - lo) * (1 + 2 * margin)
+    pixel = np.max(size / np.array(shape), axis=1)                           # (n,)
+    pixel = np.where(pixel > 0, pixel, 1.)
+    origin = (lo + hi) / 2 - pixel[:, None] * np.array(shape) / 2
+    return origin, pixel
+
+
+def fill_polygons(out, polys, image, values):
+    """
+    Fill convex polygons into out (n, H, W) in place, one pass over all of them.
+    polys: (N, k, 2) vertices in pixel units (row, col), pixel (i, j) covering [i, i+1] × [j, j+1]
+    image: (N,) index of the image each polygon goes into
+    values: (N,) pixel value of each polygon
+    A pixel is set when its center is inside the polygon.
+    """
+    n, H, W = out.shape
+    polys = polys - .5                                    # Now pixel (i, j) has its center at (i, j)
+
+    # Orient all polygons counter-clockwise
+    nxt = np.roll(polys, -1, axis=1)
+    area2 = (polys[..., 0] * nxt[..., 1] - polys[..., 1] * nxt[..., 0]).sum(axis=1)
+    polys = np.where((area2 < 0)[:, None, None], polys[:, ::-1], polys)
+    nxt = np.roll(polys, -1, axis=1)
+
+    # Pixel bounding box of each polygon
+    i0 = np.clip(np.ceil(polys[..., 0].min(axis=1)), 0, H).astype(np.int64)
+    i1 = np.clip(np.floor(polys[..., 0].max(axis=1)) + 1, 0, H).astype(np.int64)
+    j0 = np.clip(np.ceil(polys[..., 1].min(axis=1)), 0, W).astype(np.int64)
+    j1 = np.clip(np.floor(polys[..., 1].max(axis=1)) + 1, 0, W).astype(np.int64)
+    bh, bw = np.maximum(i1 - i0, 0), np.maximum(j1 - j0, 0)
+    counts = bh * bw
+    if counts.sum() == 0:
+        return out
+
+    # All the candidate pixels, tagged with the polygon they belong to
+    tile = np.repeat(np.arange(len(polys)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    ii = i0[tile] + local // bw[tile]
+    jj = j0[tile] + local % bw[tile]
+
+    # Edge functions a*i + b*j + c, non-negative on the inner side of each edge
+    a = polys[..., 1] - nxt[..., 1]
+    b = nxt[..., 0] - polys[..., 0]
+    c = -a * polys[..., 0] - b * polys[..., 1]
+    fi, fj = ii.astype(float), jj.astype(float)
+    inside = np.ones(len(tile), dtype=bool)
+    for e in range(polys.shape[1]):
+        inside &= a[tile, e] * fi + b[tile, e] * fj + c[tile, e] >= 0
+
+    flat = out.reshape(-1)                                 # A view, out is contiguous
+    flat[((image[tile] * H + ii) * W + jj)[inside]] = values[tile][inside]
+    return out
+
+
+def rasterize_batch(batch, kind, shape=(128, 128), dtype=np.uint8, margin=0.05):
+    """
+    Rasterize a batch of sample matrices (n, sample_size, 5) from Generator into (n, H, W) images.
+    Each image is fit to the bounding box of its tiles. Background is 0 and a tile of color c has value c + 1.
+    kind: "pen" for Generator5 samples, "hex" for Generator6 samples.
+    Rows of zeros (shortfall padding) are skipped.
+    """
+    batch = np.asarray(batch, dtype=float)
+    n, N, _ = batch.shape
+    polys = polygon_makers[kind](batch.reshape(-1, 5)).reshape(n, N, -1, 2)
+    valid = batch[..., 4] > 0
+
+    origin, pixel = fit_extent(polys, valid, shape, margin)
+    polys = (polys - origin[:, None, None, :]) / pixel[:, None, None, None]
+
+    out = np.zeros((n,) + tuple(shape), dtype=dtype)
+    image = np.repeat(np.arange(n), N)
+    keep = valid.ravel()
+    fill_polygons(out, polys.reshape(n * N, -1, 2)[keep], image[keep], (batch[..., 2].ravel() + 1)[keep])
+    return out
+
+
+def rasterize(sample, kind, shape=(128, 128), dtype=np.uint8, margin=0.05):
+    """
+    Rasterize one (sample_size, 5) matrix from Generator.get_sample into an (H, W) image, see rasterize_batch.
+    """
+    return rasterize_batch(np.asarray(sample)[None], kind, shape, dtype, margin)[0]
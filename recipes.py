@@ -0,0 +1,96 @@
+import os
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+# What Generator.replay needs to remake a sample: the image index and the canvas and mask placement
+RECIPE_DTYPE = np.dtype([("image", np.int32), ("theta", np.float64), ("x0", np.float64), ("y0", np.float64),
+                         ("thetamask", np.float64)])
+
+
+def check_replayable(generator):
+    """ Raise a ValueError for generators whose samples are not fixed by their recipes. """
+    if not generator.replayable:
+        raise ValueError(f"{type(generator).__name__}: pentagrid generators draw random offsets "
+                         "and cannot be replayed")
+
+
+def generator_config(generator):
+    """
+    What else a sample depends on: the canvas (0 tiles without one), the generator settings
+    and the masks (by a checksum of their sizes).
+    """
+    heights, widths, ons = generator.imageset.mask_sizes()
+    masks = zlib.crc32(b"".join(np.ascontiguousarray(a, dtype=np.int64).tobytes() for a in (heights, widths, ons)))
+    return dict(kind=generator.kind, sample_size=generator.sample_size, unit_side=generator.unit_side,
+                halfside=float(generator.halfside), coverage=generator.coverage,
+                pyramid_pixels=-1 if generator.pyramid_pixels is None else generator.pyramid_pixels,
+                tiles=0 if generator.sides is None else len(generator.sides),
+                images=len(generator.imageset), masks=masks)
+
+
+def save_recipes(path, generator, recipes):
+    """ Write recipes (a RECIPE_DTYPE array) with the generator_config they go with to the .npz file path. """
+    check_replayable(generator)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as fo:
+        np.savez(fo, recipes=np.asarray(recipes, dtype=RECIPE_DTYPE), **generator_config(generator))
+    os.replace(tmp, path)
+    return path
+
+
+def load_recipes(path, generator=None):
+    """
+    The recipes in file path. Given the generator to replay them with, check that it is set up as the one
+    that drew them, as otherwise replay would silently make other samples.
+    """
+    data = np.load(path)
+    if generator is not None:
+        check_replayable(generator)
+        config = generator_config(generator)
+        mismatch = {k: (data[k].item(), v) for k, v in config.items() if data[k].item() != v}
+        if mismatch:
+            raise ValueError(f"Recipes of {path} were drawn by another setup (saved, current): {mismatch}")
+    return data["recipes"]
+
+
+def export_recipes(generator, num_samples, path, seed=0):
+    """ Draw num_samples recipes from default_rng(seed) and save them at path. """
+    check_replayable(generator)
+    recipes = generator.draw_recipes(num_samples, np.random.default_rng(seed))
+    return save_recipes(path, generator, recipes)
+
+
+def replay_batches(generator, recipes, batch_size):
+    """ Iterate over the (batch, names) of generator.replay on successive batch_size slices of recipes. """
+    for i in range(0, len(recipes), batch_size):
+        yield generator.replay(recipes[i:i + batch_size])
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from ImageSet import ImageSet
+    from Generator import Generator5
+
+    try:
+        path = sys.argv[1]
+        num_samples = int(sys.argv[2])
+    except:
+        print(f"Usage: python {sys.argv[0]} <recipes.npz> <num_samples>")
+        print("Using default values")
+        path, num_samples = "data/recipes_pen.npz", 10000
+
+    imageset = ImageSet("data/MPEG7")
+    generator5 = Generator5(imageset, sample_size=500, target_halfside=5., unit_side=.1, cache_dir="data/cache")
+    export_recipes(generator5, num_samples, path)
+    recipes = load_recipes(path, generator5)
+    print(f"{len(recipes)} recipes in {os.path.getsize(path) / 1024:.0f} KiB")
+
+    t0 = time.perf_counter()
+    for batch, names in replay_batches(generator5, recipes, 256):
+        pass
+    print(f"Replayed in {time.perf_counter() - t0:.2f}s")
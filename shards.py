@@ -0,0 +1,130 @@
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def shard_name(i):
+    return f"shard_{i:05d}.bin"
+
+
+class ShardWriter:
+    """
+    Write (sample_size, 5) sample matrices as float32 into fixed-size shard files in folder path,
+        <path>/shard_NNNNN.bin: samples_per_shard matrices back to back (the last shard may be shorter)
+        <path>/index.npz: sample_size and samples_per_shard, and for each sample
+            its shard, offset (in bytes, within the shard), classid, name and seed
+    Use as a context manager, or call close() to write the index.
+    """
+    def __init__(self, path, sample_size, samples_per_shard=4096):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.sample_size = sample_size
+        self.samples_per_shard = samples_per_shard
+        self.sample_bytes = sample_size * 5 * 4
+        self.shards, self.offsets, self.classids, self.names, self.seeds = [], [], [], [], []
+        self._file = None
+
+    def add(self, matrix, classid, name, seed):
+        """ Append one sample matrix, seed being what reproduces it (e.g. the seed of its rng). """
+        matrix = np.asarray(matrix, dtype=np.float32)
+        if matrix.shape != (self.sample_size, 5):
+            raise ValueError(f"Expected a ({self.sample_size}, 5) matrix, got {matrix.shape}")
+
+        shard, position = divmod(len(self.names), self.samples_per_shard)
+        if position == 0:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(self.path / shard_name(shard), "wb")
+        self._file.write(matrix.tobytes())
+
+        self.shards.append(shard)
+        self.offsets.append(position * self.sample_bytes)
+        self.classids.append(classid)
+        self.names.append(name)
+        self.seeds.append(seed)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        with open(self.path / "index.npz.tmp", "wb") as fo:
+            np.savez(fo, sample_size=self.sample_size, samples_per_shard=self.samples_per_shard,
+                     shard=np.array(self.shards, dtype=np.int32), offset=np.array(self.offsets, dtype=np.int64),
+                     classid=np.array(self.classids, dtype=np.int32), name=np.array(self.names, dtype=str),
+                     seed=np.array(self.seeds, dtype=np.uint64))
+        os.replace(self.path / "index.npz.tmp", self.path / "index.npz")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """
+    Read side of ShardWriter: the shards are memory-mapped (when first needed),
+    and reader[i] is a read-only (sample_size, 5) float32 view into them.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        index = np.load(self.path / "index.npz")
+        self.sample_size = int(index["sample_size"])
+        self.samples_per_shard = int(index["samples_per_shard"])
+        self.shards = index["shard"]
+        self.offsets = index["offset"]
+        self.classids = index["classid"]
+        self.names = [str(n) for n in index["name"]]
+        self.seeds = index["seed"]
+        self._maps = {}
+
+    def _shard(self, shard):
+        if shard not in self._maps:
+            data = np.memmap(self.path / shard_name(shard), dtype=np.float32, mode="r")
+            self._maps[shard] = data.reshape(-1, self.sample_size, 5)
+        return self._maps[shard]
+
+    def __getitem__(self, i):
+        return self._shard(int(self.shards[i]))[int(self.offsets[i]) // (self.sample_size * 5 * 4)]
+
+    def __len__(self):
+        return len(self.shards)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def export(generator, num_samples, path, seed=0, samples_per_shard=4096):
+    """
+    Write num_samples samples of generator into shards at path.
+    Sample i is generator.get_sample(np.random.default_rng(seeds[i])), the seeds being drawn from SeedSequence(seed),
+    so any one sample can be regenerated from its index entry.
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(num_samples, dtype=np.uint64)
+    class_ids = generator.imageset.class_name_to_id
+    with ShardWriter(path, generator.sample_size, samples_per_shard) as writer:
+        for s in seeds.tolist():
+            matrix, name = generator.get_sample(np.random.default_rng(s))
+            writer.add(matrix, class_ids[name.rsplit("-", 1)[0]], name, s)
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+
+    try:
+        path = sys.argv[1]
+    except:
+        print(f"Usage: python {sys.argv[0]} <shard_folder>")
+        print("Using default values")
+        path = "data/shards_pen"
+
+    reader = ShardReader(path)
+    num_shards = reader.shards.max() + 1 if len(reader) else 0
+    print(f"{len(reader)} samples of size {reader.sample_size} in {num_shards} shards")
+    for i in range(min(len(reader), 5)):
+        m = reader[i]
+        print(f"{i:5d} {reader.names[i]:20s} class {reader.classids[i]:3d} seed {reader.seeds[i]:20d} "
+              f"tiles {int((m[:, 4] > 0).sum()):4d}")
@@ -0,0 +1,202 @@
+import io
+import os
+import gzip
+import time
+import tarfile
+import zipfile
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+
+def encode(name, data, compress=False):
+    """
+    The (name, bytes) to store for data (str or bytes).
+    With compress, data is gzipped (with a zero timestamp, so the output is reproducible)
+    and name gets the suffix .svgz for an .svg, or .gz otherwise.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    if compress:
+        data = gzip.compress(data, mtime=0)
+        name = name[:-4] + ".svgz" if name.endswith(".svg") else name + ".gz"
+    return name, data
+
+
+class FileSink:
+    """
+    Write each item to its own file in folder (name can have subfolders).
+    put(name, data) is write(*encode(name, data)), so that callers can encode items in parallel
+    and still write them one at a time in their own order.
+    """
+    def __init__(self, folder, compress=False):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.compress = compress
+
+    def encode(self, name, data):
+        return encode(name, data, self.compress)
+
+    def put(self, name, data):
+        self.write(*self.encode(name, data))
+
+    def write(self, name, data):
+        """ Store the already encoded data as name. """
+        path = self.folder / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as fo:
+            fo.write(data)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TarSink(FileSink):
+    """
+    Append the items to one (uncompressed) tar archive at path.
+    The members are compressed one by one if compress, so any one can still be read out on its own.
+    They get a zero timestamp, as in encode, so the archive only depends on the items and their order.
+    """
+    def __init__(self, path, compress=False):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.compress = compress
+        self._tar = tarfile.open(path, "w")
+        self._lock = threading.Lock()
+
+    def write(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = 0
+        with self._lock:
+            self._tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self._tar.close()
+
+
+class ZipSink(FileSink):
+    """
+    Append the items to one zip archive at path, stored as given (gzipped beforehand if compress).
+    They get the earliest zip timestamp, so the archive only depends on the items and their order.
+    """
+    def __init__(self, path, compress=False):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.compress = compress
+        self._zip = zipfile.ZipFile(path, "w", zipfile.ZIP_STORED)
+        self._lock = threading.Lock()
+
+    def write(self, name, data):
+        info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+        info.external_attr = 0o644 << 16
+        with self._lock:
+            self._zip.writestr(info, data)
+
+    def close(self):
+        self._zip.close()
+
+
+def open_sink(target, compress=False):
+    """ A TarSink for a .tar path, a ZipSink for a .zip path, else a FileSink on the folder target. """
+    suffix = os.path.splitext(str(target))[1].lower()
+    if suffix == ".tar":
+        return TarSink(target, compress)
+    if suffix == ".zip":
+        return ZipSink(target, compress)
+    return FileSink(target, compress)
+
+
+class BackgroundWriter:
+    """
+    Write to a sink from a pool of worker threads, so that generation and I/O overlap.
+        workers: number of writer threads
+        max_pending: most items submitted but not yet written; submit blocks beyond that, bounding the memory held
+    The items are built and encoded in parallel, but written in the order they were submitted,
+    so an archive comes out the same whatever the timing of the threads.
+    The first error of a worker is raised again by the next submit, or by close.
+    Use as a context manager, or call close() to wait for the pending items and close the sink.
+    """
+    def __init__(self, sink, workers=4, max_pending=64):
+        if workers < 1 or max_pending < 1:
+            raise ValueError(f"workers and max_pending must be at least 1, got {workers} and {max_pending}")
+        self.sink = sink
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor = ThreadPoolExecutor(workers)
+        self._error = None
+        self._submitted = 0                     # Sequence number of the next item submitted
+        self._turn = 0                          # and of the next one to be written
+        self._turn_changed = threading.Condition()
+
+    def _write(self, seq, name, data):
+        try:
+            item = self.sink.encode(name, data() if callable(data) else data)
+        except BaseException as e:
+            self._error = self._error or e
+            item = None
+
+        # The executor starts items in order, so the one whose turn it is never waits for a free thread
+        with self._turn_changed:
+            self._turn_changed.wait_for(lambda: self._turn == seq)
+            try:
+                if item is not None:
+                    self.sink.write(*item)
+            except BaseException as e:
+                self._error = self._error or e
+            finally:
+                self._turn += 1
+                self._turn_changed.notify_all()
+                self._slots.release()
+
+    def _raise(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def submit(self, name, data):
+        """
+        Queue data (str or bytes) to be written as name.
+        data can also be a callable returning str or bytes, called in a worker
+        (e.g. partial(pen_save_svg, grid, None) to also build the svg there).
+        """
+        self._raise()
+        self._slots.acquire()
+        self._executor.submit(self._write, self._submitted, name, data)
+        self._submitted += 1
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.sink.close()
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == "__main__":
+    import sys
+
+    try:
+        target = sys.argv[1]
+        num_items = int(sys.argv[2])
+    except:
+        print(f"Usage: python {sys.argv[0]} <folder|archive.tar|archive.zip> <num_items>")
+        print("Using default values")
+        target, num_items = "data/sink_test.tar", 1000
+
+    payload = "<svg>" + "<path d='M 0 0 L 1 1'/>" * 500 + "</svg>"
+    for compress in (False, True):
+        t0 = time.perf_counter()
+        with BackgroundWriter(open_sink(target, compress)) as writer:
+            for i in range(num_items):
+                writer.submit(f"item{i:06d}.svg", payload)
+        print(f"compress={compress}: {num_items} items to {target} in {time.perf_counter() - t0:.2f}s")
@@ -1,5 +1,6 @@
 import math
 import cmath
+from abc import ABC, abstractmethod
 from collections import Counter
 
 TOL = 1e-6
@@ -41,15 +42,51 @@ def display_svg(filename):
 
 import numpy as np
 
+
+def svg_numbers(q, precision=0):
+    """
+    The integers q as the numbers q / 10**precision (trailing zeros dropped), as strings for an SVG path.
+    """
+    if precision == 0:
+        return [str(v) for v in q]
+    return [f"{v:.{precision}f}".rstrip("0").rstrip(".") for v in (np.asarray(q) / 10 ** precision).tolist()]
+
+
+def svg_join(strings):
+    """ Space separated, but the minus signs serve as separators too. """
+    return " ".join(strings).replace(" -", "-")
+
+
+def svg_polygons_compact(xq, yq, precision=0):
+    """
+    One SVG "d" path with all the polygons of the (N, k) integer vertex coordinates xq, yq
+    (in units of 10**-precision) as subpaths, in relative commands:
+    m from the start of the previous polygon, the implicit lines along the edges, and z.
+    """
+    xq, yq = np.asarray(xq, dtype=np.int64), np.asarray(yq, dtype=np.int64)
+    if len(xq) == 0:
+        return ""
+    moves = np.stack([np.diff(xq[:, 0], prepend=0), np.diff(yq[:, 0], prepend=0)], axis=1)
+    edges = np.stack([np.diff(xq, axis=1), np.diff(yq, axis=1)], axis=2).reshape(len(xq), -1)
+    numbers = np.concatenate([moves, edges], axis=1)
+    strings = svg_numbers(numbers.ravel().tolist(), precision)
+    n = numbers.shape[1]
+    return "".join(f"m{svg_join(strings[i:i + n])}z" for i in range(0, len(strings), n))
+
+
 def inscribed_square_halfside(grid):
     """
     Given N points where the first two columns are (x, y),
     rotate by 45°, find the limiting extent, and return diag/sqrt(2).
+    grid is either an iterable of tiles with a .center or an (N, 2) array of centers.
     """
-    centers = [h.center for h in grid]
-    if isinstance(centers[0], complex):
-        centers = [reim(c) for c in centers]
-    xy = np.array(centers, dtype=float)
+    if isinstance(grid, np.ndarray):
+        xy = grid[:, :2].astype(float)
+    else:
+        centers = [h.center for h in grid]
+        if isinstance(centers[0], complex):
+            centers = [reim(c) for c in centers]
+        xy = np.array(centers, dtype=float)
 
     theta = np.deg2rad(45)
     R = np.array([[np.cos(theta), -np.sin(theta)],
@@ -112,3 +149,134 @@ def zealous_crop(arr, margin=0):
     # Crop the array
     return arr[top:bottom+1, left:right+1]
 
+
+
+def summed_area_table(arr):
+    """
+    Summed-area table with a leading row and column of zeros, S[a, b] = arr[:a, :b].sum().
+    """
+    sat = np.zeros((arr.shape[0] + 1, arr.shape[1] + 1), dtype=np.int32)
+    np.cumsum(np.cumsum(arr, axis=0, dtype=np.int32), axis=1, out=sat[1:, 1:])
+    return sat
+
+
+def halve_mask(mask):
+    """
+    Half resolution 0/1 mask: pixel (i, j) is on when at least two of pixels (2i..2i+1, 2j..2j+1) are.
+    Odd sides are padded with an off row/column, so index i of the full mask maps to i >> 1.
+    """
+    H, W = mask.shape
+    padded = np.pad(mask, ((0, H % 2), (0, W % 2)))
+    blocks = padded.reshape((H + 1) // 2, 2, (W + 1) // 2, 2).sum(axis=(1, 3), dtype=np.uint8)
+    return (blocks >= 2).astype(np.uint8)
+
+
+def mask_pyramid(mask, min_side=4):
+    """
+    Mipmap of a 0/1 mask: [mask, halve_mask(mask), ...] down to the last level whose sides are at least min_side.
+    Pixel (i, j) of the full mask falls in pixel (i >> L, j >> L) of level L.
+    """
+    levels = [mask]
+    while min(levels[-1].shape) >= 2 * min_side:
+        levels.append(halve_mask(levels[-1]))
+    return levels
+
+
+def mask_pixels(flat, index, packed_bits=False):
+    """
+    The pixels at index of a flat array of raveled masks, or of masks packed 8 pixels a byte
+    (in np.packbits order) when packed_bits.
+    """
+    if not packed_bits:
+        return flat[index]
+    return (flat[index >> 3] >> (7 - (index & 7)).astype(np.uint8)) & 1
+
+
+def box_coverage(sats, offsets, H, W, pu, pv, halfside):
+    """
+    Exact fraction of the square [pu ± halfside] × [pv ± halfside] covered by a binary mask,
+    where pixel (i, j) of the H×W mask spans [i-½, i+½] × [j-½, j+½] and everything outside the mask is off.
+
+    The integral of the mask up to a point is the bilinear interpolation of its summed-area table,
+    so the result takes four such interpolations.
+        sats: flat array holding the raveled summed-area tables
+        offsets: where the table of each mask starts in sats
+    All arguments broadcast against each other.
+    """
+    def integral(a, b):
+        a = np.clip(a + .5, 0, H)
+        b = np.clip(b + .5, 0, W)
+        a0 = np.minimum(np.floor(a), H - 1).astype(np.int64)
+        b0 = np.minimum(np.floor(b), W - 1).astype(np.int64)
+        fa, fb = a - a0, b - b0
+        i = offsets + a0 * (W + 1) + b0
+        return ((sats[i] * (1 - fb) + sats[i + 1] * fb) * (1 - fa) +
+                (sats[i + W + 1] * (1 - fb) + sats[i + W + 2] * fb) * fa)
+
+    u0, u1 = pu - halfside, pu + halfside
+    v0, v1 = pv - halfside, pv + halfside
+    area = integral(u1, v1) - integral(u0, v1) - integral(u1, v0) + integral(u0, v0)
+    return area / (2 * halfside) ** 2
+
+
+class ArrayGrid(ABC):
+    """
+    A grid of tiles backed by an (N, 5) matrix of (x, y, color, angle, side) rows, as made by the Generators.
+    The matrix is wrapped without a copy (when it is already floating point), so the transforms change it in place.
+    Subclasses make the per-tile objects, only when a tile is accessed.
+    """
+    def __init__(self, matrix):
+        matrix = np.asarray(matrix)
+        self.matrix = matrix if np.issubdtype(matrix.dtype, np.floating) else matrix.astype(float)
+
+    @property
+    def x(self):
+        return self.matrix[:, 0]
+
+    @property
+    def y(self):
+        return self.matrix[:, 1]
+
+    @property
+    def colors(self):
+        return self.matrix[:, 2]
+
+    @property
+    def angles(self):
+        return self.matrix[:, 3]
+
+    @property
+    def sides(self):
+        return self.matrix[:, 4]
+
+    def rotate(self, alpha):
+        c, s = math.cos(alpha), math.sin(alpha)
+        x = self.x.copy()
+        self.matrix[:, 0] = x * c - self.y * s
+        self.matrix[:, 1] = x * s + self.y * c
+        self.matrix[:, 3] += alpha
+
+    def translate(self, dx, dy):
+        self.matrix[:, 0] += dx
+        self.matrix[:, 1] += dy
+
+    def scale(self, factor):
+        self.matrix[:, [0, 1, 4]] *= factor
+
+    @abstractmethod
+    def tile(self, i):
+        raise NotImplementedError
+
+    def __getitem__(self, i):
+        return self.tile(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.tile(i)
+
+    def __len__(self):
+        return len(self.matrix)
+
+    @property
+    def side(self):
+        return self.matrix[0, 4]
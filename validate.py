@@ -0,0 +1,200 @@
+import time
+import numpy as np
+
+from pen_base import TOL, TriangleGrid, reparametrize_arrays
+from pen_array import TriangleArray
+from pen_svg import rhombus_vertices
+from raster import rhombus_polygons
+
+
+def neighbor_pairs(xy, radius):
+    """
+    All the pairs (i, j), i < j, of points within distance radius of each other, and their distances.
+    Points are bucketed in square cells of side radius, so only the pairs in the same or adjacent cells are checked.
+    """
+    xy = np.asarray(xy, dtype=float)
+    ij = np.floor((xy - xy.min(axis=0)) / radius).astype(np.int64)
+    ny = int(ij[:, 1].max()) + 3                              # A column of padding on either side, so no wrapping
+    cell = ij[:, 0] * ny + ij[:, 1] + 1
+    order = np.argsort(cell, kind="stable")
+    sorted_cell = cell[order]
+
+    I, J = [], []
+    for di, dj in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):  # Each pair of adjacent cells once
+        target = cell + di * ny + dj
+        lo = np.searchsorted(sorted_cell, target, "left")
+        counts = np.searchsorted(sorted_cell, target, "right") - lo
+        i = np.repeat(np.arange(len(xy)), counts)
+        j = order[np.repeat(lo, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+        keep = i < j if (di, dj) == (0, 0) else np.ones(len(i), dtype=bool)
+        I.append(i[keep])
+        J.append(j[keep])
+
+    I, J = np.concatenate(I), np.concatenate(J)
+    d = np.hypot(*(xy[I] - xy[J]).T)
+    near = d <= radius
+    return I[near], J[near], d[near]
+
+
+def nearest_neighbor_distances(xy, radius):
+    """ Distance of each point to its closest other point, inf if there is none within radius. """
+    I, J, d = neighbor_pairs(xy, radius)
+    nn = np.full(len(xy), np.inf)
+    np.minimum.at(nn, I, d)
+    np.minimum.at(nn, J, d)
+    return nn
+
+
+def overlap_depths(polys, I, J, num_axes=None):
+    """
+    Penetration depth of each pair of convex polygons (I[k], J[k]) by the separating axis theorem:
+    the least overlap of their projections on the edge normals of both. Zero (or negative) when they only touch.
+    num_axes: only use the normals of the first so many edges of each polygon (2 is enough for parallelograms).
+    """
+    P = np.ascontiguousarray(polys[I].transpose(1, 0, 2))                        # (k, m, 2)
+    Q = np.ascontiguousarray(polys[J].transpose(1, 0, 2))
+    depth = np.full(len(I), np.inf)
+    for poly in (P, Q):
+        for e in range(num_axes or len(poly)):
+            edge = poly[(e + 1) % len(poly)] - poly[e]
+            nx, ny = -edge[:, 1], edge[:, 0]
+            p, q = P[..., 0] * nx + P[..., 1] * ny, Q[..., 0] * nx + Q[..., 1] * ny
+            overlap = (np.minimum(p.max(axis=0), q.max(axis=0)) - np.maximum(p.min(axis=0), q.min(axis=0)))
+            depth = np.minimum(depth, overlap / np.hypot(nx, ny))
+    return depth
+
+
+def check_roundtrip(tiles):
+    """
+    Largest distance between a triangle's vertices and those of Rhombus(triangle).triangle(),
+    which gives back either the triangle or its mirror image about the base (B going to D),
+    as both make the same rhombus.
+    Returns the error and the number of triangles that came back mirrored.
+    """
+    center, tilt, side = reparametrize_arrays(tiles.A, tiles.B, tiles.C)
+    A, B, C, _ = rhombus_vertices(center, tilt, side, tiles.fatt)
+    dB, dD = abs(B - tiles.B), abs(B - (tiles.A - tiles.B + tiles.C))
+    error = np.maximum(np.maximum(abs(A - tiles.A), abs(C - tiles.C)), np.minimum(dB, dD))
+    return float(error.max()), int((dD < dB).sum())
+
+
+def check_mirrors(tiles):
+    """
+    Triangles sharing the center of their base should come in mirror image pairs (same base, B reflected to D).
+    Returns (number of pairs, number of centers shared by more than two triangles, worst mirror mismatch).
+    """
+    centers = tiles.centers
+    keys = np.stack([np.round(centers.real / TOL), np.round(centers.imag / TOL)], axis=1).astype(np.int64)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    crowded = int((counts > 2).sum())
+
+    order = np.argsort(inverse.ravel(), kind="stable")
+    pairs = order[np.isin(inverse.ravel()[order], np.flatnonzero(counts == 2))].reshape(-1, 2)
+    a, b = pairs[:, 0], pairs[:, 1]
+    same_base = np.minimum(abs(tiles.A[a] - tiles.A[b]) + abs(tiles.C[a] - tiles.C[b]),
+                           abs(tiles.A[a] - tiles.C[b]) + abs(tiles.C[a] - tiles.A[b]))
+    mirrored = abs(tiles.A[a] + tiles.C[a] - tiles.B[a] - tiles.B[b])
+    worst = float(np.maximum(same_base, mirrored).max()) if len(pairs) else 0.
+    return len(pairs), crowded, worst
+
+
+def arc_mismatches(matrix, quantum=1e-3):
+    """
+    The arcs of neighbouring rhombuses should join up (the matching rule of the P3 tiling): each edge midpoint
+    of a rhombus is on its arc about A or about C (see pen_svg.svg_arcs), and two rhombuses sharing an edge
+    should have the same one there.
+    matrix: (N, 5) Penrose matrix (x, y, color, tilt, side), with all sides equal.
+    Midpoints are matched on a grid of quantum × side.
+    Returns (number of shared edges, number of them where the arcs do not match).
+    """
+    center = matrix[:, 0] + 1j * matrix[:, 1]
+    A, B, C, D = rhombus_vertices(center, matrix[:, 3], matrix[:, 4], matrix[:, 2] != 0)
+    midpoints = np.concatenate([(A + B) / 2, (A + D) / 2, (C + B) / 2, (C + D) / 2])
+    about_a = np.repeat([True, True, False, False], len(matrix))
+
+    step = quantum * float(matrix[:, 4].max())
+    keys = np.stack([np.round(midpoints.real / step), np.round(midpoints.imag / step)], axis=1).astype(np.int64)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    order = np.argsort(inverse, kind="stable")
+    shared = order[np.isin(inverse[order], np.flatnonzero(counts == 2))].reshape(-1, 2)
+    return len(shared), int((about_a[shared[:, 0]] != about_a[shared[:, 1]]).sum())
+
+
+def validate_rhombuses(matrix, tol=1e-6):
+    """
+    Checks on an (N, 5) Penrose matrix (x, y, color, tilt, side), rows with side 0 being ignored:
+        nearest neighbour spacing of the centers (no duplicates, no isolated tiles)
+        no two rhombuses overlap
+        the arcs match across shared edges (see arc_mismatches)
+    Tolerances are relative to the side.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    matrix = matrix[matrix[:, 4] > 0]
+    side = float(matrix[:, 4].max())
+    xy = matrix[:, :2]
+
+    # The centers of rhombuses sharing an edge are less than a side apart
+    nn = nearest_neighbor_distances(xy, side)
+    spacing, counts = np.unique(np.round(nn[np.isfinite(nn)] / side, 3), return_counts=True)
+    nearest = dict(passed=bool(len(xy) < 2 or (nn.min() > 1e-3 * side and np.isfinite(nn).all())),
+                   min=float(nn.min()) if len(xy) else None, isolated=int((~np.isfinite(nn)).sum()),
+                   histogram={float(s): int(c) for s, c in zip(spacing, counts)})
+
+    # Overlapping rhombuses have centers less than two sides apart
+    I, J, _ = neighbor_pairs(xy, 2 * side)
+    depth = overlap_depths(rhombus_polygons(matrix), I, J, num_axes=2)
+    worst = float(depth.max()) if len(depth) else 0.
+    overlap = dict(passed=worst <= tol * side, worst_depth=worst, pairs_checked=len(I),
+                   overlapping=int((depth > tol * side).sum()))
+
+    shared, mismatched = arc_mismatches(matrix)
+    arcs = dict(passed=mismatched == 0, shared_edges=shared, mismatched=mismatched)
+    return dict(tiles=len(xy), nearest_neighbor=nearest, overlap=overlap, arcs=arcs)
+
+
+def validate(tiling, tol=1e-6):
+    """
+    Validate a P3 tiling (TriangleGrid or TriangleArray) in bulk:
+        roundtrip: Rhombus(t).triangle() gives back the vertices of t
+        mirrors: triangles sharing a base center are mirror images, at most two of them
+        and validate_rhombuses on the rhombuses it makes (as PenGrid does).
+    Returns a report dict with "passed", the worst errors of each check and the time taken.
+    """
+    t0 = time.perf_counter()
+    tiles = TriangleArray.from_grid(tiling) if isinstance(tiling, TriangleGrid) else tiling
+    side = float(np.max(abs(tiles.B - tiles.A)))
+
+    worst, mirrored = check_roundtrip(tiles)
+    roundtrip = dict(passed=worst <= tol * side, worst_error=worst, mirrored=mirrored)
+
+    pairs, crowded, worst = check_mirrors(tiles)
+    mirrors = dict(passed=crowded == 0 and worst <= tol * side, pairs=pairs, crowded_centers=crowded, worst_error=worst)
+
+    pengrid = tiles.to_pengrid()
+    matrix = np.array([(r.x, r.y, r.color, r.tilt, r.side) for r in pengrid], dtype=float)
+    report = dict(triangles=len(tiles), side=side, roundtrip=roundtrip, mirrors=mirrors,
+                  **validate_rhombuses(matrix, tol))
+    checks = ("roundtrip", "mirrors", "nearest_neighbor", "overlap", "arcs")
+    report["passed"] = all(report[k]["passed"] for k in checks)
+    report["seconds"] = time.perf_counter() - t0
+    return report
+
+
+if __name__ == '__main__':
+    import sys
+    import json
+    from pen_shapes import circle_tiling
+
+    try:
+        level = int(sys.argv[1])
+    except:
+        print(f"Usage: python {sys.argv[0]} <inflation_level>")
+        print("Using default values")
+        level = 10
+
+    tiles = TriangleArray.from_grid(circle_tiling)
+    tiles.inflate(level)
+    report = validate(tiles)
+    print(json.dumps(report, indent=1))
+    sys.exit(0 if report["passed"] else 1)